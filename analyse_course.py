@@ -3,7 +3,7 @@ import os
 import re
 import sys
 
-csv.field_size_limit(10000000)
+from lib.output_backends import has_course_tables, read_rows
 
 # --- Argument parsing ---
 if len(sys.argv) != 2:
@@ -13,112 +13,107 @@ if len(sys.argv) != 2:
 else:
     COURSE_PATH = sys.argv[1]
 
-if not os.path.isdir(COURSE_PATH):
+if not has_course_tables(COURSE_PATH):
     print(f"Error: Folder '{COURSE_PATH}' does not exist.")
     sys.exit(1)
 
 COURSE_FOLDER = os.path.basename(COURSE_PATH)
 
-# File paths
-SECTIONS_CSV = os.path.join(COURSE_PATH, f'{COURSE_FOLDER}_sections.csv')
-MODULES_CSV = os.path.join(COURSE_PATH, f'{COURSE_FOLDER}_modules.csv')
-LABELS_CSV = os.path.join(COURSE_PATH, f'{COURSE_FOLDER}_labels.csv')
-PAGES_CSV = os.path.join(COURSE_PATH, f'{COURSE_FOLDER}_pages.csv')
-BOOKS_CSV = os.path.join(COURSE_PATH, f'{COURSE_FOLDER}_books.csv')
-FILES_CSV = os.path.join(COURSE_PATH, f'{COURSE_FOLDER}_files.csv')
-FOLDERS_CSV = os.path.join(COURSE_PATH, f'{COURSE_FOLDER}_folders.csv')
-URLS_CSV = os.path.join(COURSE_PATH, f'{COURSE_FOLDER}_urls.csv')
-FORUMS_CSV = os.path.join(COURSE_PATH, f'{COURSE_FOLDER}_forums.csv')
-
+# Course tables, read from their CSV or Parquet file (only the columns used here)
+SECTIONS_TABLE = 'sections'
+MODULES_TABLE = 'modules'
+LABELS_TABLE = 'labels'
+PAGES_TABLE = 'pages'
+BOOKS_TABLE = 'books'
+FILES_TABLE = 'files'
+FOLDERS_TABLE = 'folders'
+URLS_TABLE = 'urls'
+FORUMS_TABLE = 'forums'
+
+os.makedirs(COURSE_PATH, exist_ok=True)
 OUTPUT_CSV = os.path.join(COURSE_PATH, 'course_analysis.csv')
 
-# Helper: Read CSV as list of dicts
-def read_csv_dict(filepath):
-    with open(filepath, encoding='utf-8') as f:
-        reader = csv.DictReader(f)
-        return list(reader)
+# Helper: Read a course table as list of dicts
+def read_table_rows(table, columns=None):
+    return read_rows(COURSE_PATH, table, columns)
 
 # 1. Build section mappings using both section number and section ID
 sections_by_num = {}  # section number -> name
 sections_by_id = {}   # section ID -> name
 try:
-    for row in read_csv_dict(SECTIONS_CSV):
+    for row in read_table_rows(SECTIONS_TABLE, ['section', 'id', 'name']):
         section_num = str(row['section'])
         section_id = str(row['id'])
         section_name = row['name']
         sections_by_num[section_num] = section_name
         sections_by_id[section_id] = section_name
 except FileNotFoundError:
-    print(f"Error: {SECTIONS_CSV} not found.")
+    print(f"Error: {SECTIONS_TABLE} table not found in {COURSE_PATH}.")
     sys.exit(1)
 
 # 2. Build regular module info from modules.csv
 modules = {}
 try:
-    with open(MODULES_CSV, encoding='utf-8') as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            cmid = str(row['coursemodule'])
-            modules[cmid] = {
-                'module_id': row['id'],
-                'name': row['name'],
-                'section_num': str(row['section']),
-                'source': 'modules.csv'
-            }
+    for row in read_table_rows(MODULES_TABLE, ['coursemodule', 'id', 'name', 'section']):
+        cmid = str(row['coursemodule'])
+        modules[cmid] = {
+            'module_id': row['id'],
+            'name': row['name'],
+            'section_num': str(row['section']),
+            'source': 'modules.csv'
+        }
 except FileNotFoundError:
-    print(f"Error: {MODULES_CSV} not found.")
+    print(f"Error: {MODULES_TABLE} table not found in {COURSE_PATH}.")
     sys.exit(1)
 
 # 3. Add labels from labels.csv as they are separate modules
 label_content = {}
 label_clean_text = {}
 try:
-    with open(LABELS_CSV, encoding='utf-8') as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            cmid = str(row['label_cmid'])
-            section_id = str(row['label_section_id'])
-            
-            # Map section ID to section number for consistency
-            section_num = None
-            for s_num, s_id in [(n, sid) for n, sid in zip(sections_by_num.keys(), sections_by_id.keys()) if sections_by_id[sid] == sections_by_id.get(section_id, '')]:
-                section_num = s_num
-                break
-            
-            # If we can't find section number, use the section ID directly
+    for row in read_table_rows(LABELS_TABLE, ['label_cmid', 'label_section_id', 'label_id', 'label_name', 'content', 'clean_text']):
+        cmid = str(row['label_cmid'])
+        section_id = str(row['label_section_id'])
+        
+        # Map section ID to section number for consistency
+        section_num = None
+        for s_num, s_id in [(n, sid) for n, sid in zip(sections_by_num.keys(), sections_by_id.keys()) if sections_by_id[sid] == sections_by_id.get(section_id, '')]:
+            section_num = s_num
+            break
+        
+        # If we can't find section number, use the section ID directly
+        if section_num is None:
+            # Find section number by matching section ID
+            for s_num, s_name in sections_by_num.items():
+                if sections_by_id.get(section_id, '') == s_name:
+                    section_num = s_num
+                    break
             if section_num is None:
-                # Find section number by matching section ID
-                for s_num, s_name in sections_by_num.items():
-                    if sections_by_id.get(section_id, '') == s_name:
-                        section_num = s_num
-                        break
-                if section_num is None:
-                    section_num = f"id_{section_id}"
-            
-            modules[cmid] = {
-                'module_id': row['label_id'],
-                'name': row['label_name'],
-                'section_num': section_num,
-                'source': 'labels.csv'
-            }
-            
-            # Store label content for analysis
-            content = row.get('content', '')
-            clean_text = row.get('clean_text', '')
-            label_content[cmid] = content
-            label_clean_text[cmid] = clean_text
-            
+                section_num = f"id_{section_id}"
+        
+        modules[cmid] = {
+            'module_id': row['label_id'],
+            'name': row['label_name'],
+            'section_num': section_num,
+            'source': 'labels.csv'
+        }
+        
+        # Store label content for analysis
+        content = row.get('content', '')
+        clean_text = row.get('clean_text', '')
+        label_content[cmid] = content
+        label_clean_text[cmid] = clean_text
+        
 except FileNotFoundError:
-    print(f"Warning: {LABELS_CSV} not found")
+    print(f"Warning: {LABELS_TABLE} table not found in {COURSE_PATH}")
 
 # 4. Build coursemodule id → module type mapping
 module_type_map = {}
 
-# Helper to map cmid from a type file
-def map_type_cmid(type_csv, type_name, cmid_col):
+# Helper to map cmid from a type table
+def map_type_cmid(type_table, type_name, cmid_col):
     try:
         count = 0
-        for row in read_csv_dict(type_csv):
+        for row in read_table_rows(type_table, [cmid_col]):
             cmid = row.get(cmid_col)
             if cmid:
                 module_type_map[str(cmid)] = type_name
@@ -127,13 +122,13 @@ def map_type_cmid(type_csv, type_name, cmid_col):
         pass
 
 # Map all module types including labels
-map_type_cmid(LABELS_CSV, 'label', 'label_cmid')
-map_type_cmid(PAGES_CSV, 'page', 'page_cmid')
-map_type_cmid(BOOKS_CSV, 'book', 'book_cmid')
-map_type_cmid(FILES_CSV, 'file', 'file_cmid')
-map_type_cmid(FOLDERS_CSV, 'folder', 'folder_cmid')
-map_type_cmid(URLS_CSV, 'url', 'url_cmid')
-map_type_cmid(FORUMS_CSV, 'forum', 'forum_cmid')
+map_type_cmid(LABELS_TABLE, 'label', 'label_cmid')
+map_type_cmid(PAGES_TABLE, 'page', 'page_cmid')
+map_type_cmid(BOOKS_TABLE, 'book', 'book_cmid')
+map_type_cmid(FILES_TABLE, 'file', 'file_cmid')
+map_type_cmid(FOLDERS_TABLE, 'folder', 'folder_cmid')
+map_type_cmid(URLS_TABLE, 'url', 'url_cmid')
+map_type_cmid(FORUMS_TABLE, 'forum', 'forum_cmid')
 
 def classify_label_content(content):
     if not content or content.strip() == '':
@@ -4,6 +4,23 @@ import csv
 import re
 import sys
 
+from lib.output_backends import read_table_file
+
+# A simple regex to check for HTML tags
+HTML_PATTERN = re.compile(r'<[^>]+>')
+
+def check_field(file_name, row_label, field_name, field, errors):
+    """Report utf-8 replacement characters, carriage returns and line feeds in a field"""
+    pos = field.find("�")
+    if pos != -1:
+        errors.append(f"{file_name}, {row_label}, character position {pos+1}, utf-8 anomaly detected in field {field_name}")
+    pos = field.find("\r")
+    if pos != -1:
+        errors.append(f"{file_name}, {row_label}, character position {pos+1}, carriage return detected in field {field_name}")
+    pos = field.find("\n")
+    if pos != -1:
+        errors.append(f"{file_name}, {row_label}, character position {pos+1}, line feed detected in field {field_name}")
+
 def analyze_csv_file(file_path):
     errors = []
     html_warnings = []
@@ -47,52 +64,66 @@ def analyze_csv_file(file_path):
             field_count_mismatch = True
         # Check each field in the row for anomalies
         for col_index, field in enumerate(row):
-            pos = field.find("�")
-            if pos != -1:
-                field_name = header[col_index] if col_index < len(header) else f"column {col_index}"
-                errors.append(f"{os.path.basename(file_path)}, row {row_number}, character position {pos+1}, utf-8 anomaly detected in field {field_name}")
-            pos = field.find("\r")
-            if pos != -1:
-                field_name = header[col_index] if col_index < len(header) else f"column {col_index}"
-                errors.append(f"{os.path.basename(file_path)}, row {row_number}, character position {pos+1}, carriage return detected in field {field_name}")
-            pos = field.find("\n")
-            if pos != -1:
-                field_name = header[col_index] if col_index < len(header) else f"column {col_index}"
-                errors.append(f"{os.path.basename(file_path)}, row {row_number}, character position {pos+1}, line feed detected in field {field_name}")
+            field_name = header[col_index] if col_index < len(header) else f"column {col_index}"
+            check_field(os.path.basename(file_path), f"row {row_number}", field_name, field, errors)
         row_number += 1
 
     # Second pass: if all rows have the expected number of fields, check for HTML in each field.
     if not field_count_mismatch:
-        # A simple regex to check for HTML tags
-        html_pattern = re.compile(r'<[^>]+>')
         # We'll keep track of fields that have already been reported for HTML.
         reported_fields = set()
         # Use csv.DictReader so we can associate field content with header names.
         reader = csv.DictReader(lines)
         for row in reader:
             for field_name, field in row.items():
-                if field and field_name not in reported_fields and html_pattern.search(field):
+                if field and field_name not in reported_fields and HTML_PATTERN.search(field):
                     reported_fields.add(field_name)
         for field_name in reported_fields:
             html_warnings.append(f"{os.path.basename(file_path)}, {field_name}, html detected!!")
 
     return errors, html_warnings
 
+def analyze_table_file(file_path):
+    """The same field checks for a Parquet or JSON Lines table (its columns are fixed, so there are no header or field count checks)"""
+    errors = []
+    html_warnings = []
+    file_name = os.path.basename(file_path)
+    try:
+        table = read_table_file(file_path, as_strings=True)
+    except Exception as e:
+        errors.append(f"{file_name}, N/A, N/A, failed to open file: {e}")
+        return errors, html_warnings
+
+    reported_fields = set()
+    for row_number, row in enumerate(table.to_dict('records'), start=1):
+        for field_name, field in row.items():
+            check_field(file_name, f"row {row_number}", field_name, field, errors)
+            if field and field_name not in reported_fields and HTML_PATTERN.search(field):
+                reported_fields.add(field_name)
+    for field_name in reported_fields:
+        html_warnings.append(f"{file_name}, {field_name}, html detected!!")
+    return errors, html_warnings
+
 def analyze_folder(folder_path):
     all_errors = []
     all_html_warnings = []
-    # Loop through all files in the given folder
-    for file in os.listdir(folder_path):
-        if file.endswith('.csv'):
-            file_path = os.path.join(folder_path, file)
-            errors, html_warnings = analyze_csv_file(file_path)
+    # Loop through all CSV and JSON Lines files in the given folder, and Parquet files in it or its partitions (type=books/...)
+    for root, _, files in os.walk(folder_path):
+        for file in sorted(files):
+            file_path = os.path.join(root, file)
+            if file.endswith('.csv') and root == folder_path:
+                errors, html_warnings = analyze_csv_file(file_path)
+            elif file.endswith('.parquet') or (file.endswith('.jsonl') and root == folder_path):
+                errors, html_warnings = analyze_table_file(file_path)
+            else:
+                continue
             all_errors.extend(errors)
             all_html_warnings.extend(html_warnings)
     return all_errors, all_html_warnings
 
 if __name__ == '__main__':
     if len(sys.argv) < 2:
-        print("Usage: python analyze_csv.py <folder_path>")
+        print("Usage: python analyze_csv.py <folder_path>  (a course_data/<idnumber> folder, or course_data/parquet/course=<idnumber>)")
         sys.exit(1)
     folder_path = sys.argv[1]
     errors, html_warnings = analyze_folder(folder_path)
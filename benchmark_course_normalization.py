@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+import time
+import argparse
+import pandas as pd
+
+from lib.course_structure import normalize_course_blocks
+from lib.course_model import course_model
+
+
+def build_course(section_count, modules_per_section, block_count):
+    """A synthetic core_course_get_contents / core_block_get_course_blocks response"""
+    course_contents = []
+    module_id = 1
+    for section_number in range(section_count):
+        modules = []
+        for _ in range(modules_per_section):
+            modules.append({
+                'id': module_id, 'name': f"Module {module_id}", 'instance': module_id, 'contextid': 1000 + module_id,
+                'modname': ('book', 'page', 'label', 'resource', 'url', 'forum')[module_id % 6],
+                'visible': 1, 'url': f"https://moodle.example/mod/view.php?id={module_id}",
+                'description': f"<p>Description {module_id}</p>",
+                'contents': [{'type': 'file', 'filename': 'index.html', 'fileurl': f"https://moodle.example/pluginfile.php/{module_id}/index.html"}],
+            })
+            module_id += 1
+        course_contents.append({'id': 100 + section_number, 'name': f"Section {section_number}", 'section': section_number,
+                                'visible': 1, 'summary': '', 'modules': modules})
+    blocks = [{'instanceid': block_id, 'name': 'html', 'region': 'side-pre', 'visible': True, 'weight': block_id,
+               'configs': [{'name': 'title', 'value': f"Block {block_id}"}, {'name': 'text', 'value': f"<p>Text {block_id}</p>"}]}
+              for block_id in range(block_count)]
+    return course_contents, blocks
+
+
+def extract_block_configs(block, key):
+    configs = block.get('configs', None)
+    if configs is not None and isinstance(configs, (list, tuple, set)):
+        for item in configs:
+            if item.get('name') == key:
+                return item['value']
+    return None
+
+
+def legacy_normalization(course_contents, blocks):
+    """What set_course and get_block_content used to do: pd.concat per section, two row-wise apply passes"""
+    course_content = pd.DataFrame(course_contents)
+    course_modules = pd.DataFrame()
+    for _, course_section in course_content.iterrows():
+        modules_to_add = pd.DataFrame(course_section['modules'])
+        modules_to_add['section_id'] = course_section['id']
+        course_modules = pd.concat([course_modules, modules_to_add], ignore_index=True)
+    course_sections = course_content.drop(columns=['modules'])
+
+    course_blocks = pd.DataFrame(blocks)
+    course_blocks['block_title'] = course_blocks.apply(lambda row: extract_block_configs(row, 'title'), axis=1)
+    course_blocks['block_text'] = course_blocks.apply(lambda row: extract_block_configs(row, 'text'), axis=1)
+    return course_sections, course_modules, course_blocks
+
+
+def course_model_normalization(course_contents, blocks):
+    """What set_course does now: a course_model of the response, with the sections and modules frames the output uses"""
+    model = course_model.from_contents(course_contents)
+    return model.get_sections_frame(), model.get_modules_frame(), normalize_course_blocks(blocks)
+
+
+def time_run(normalize, course_contents, blocks, repeats):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        result = normalize(course_contents, blocks)
+    return (time.perf_counter() - start) / repeats, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the old per-section pd.concat course normalization with the course_model set_course builds now.")
+    parser.add_argument("--sections", type=int, default=100, help="Sections in the synthetic course")
+    parser.add_argument("--modules-per-section", type=int, default=50, help="Modules per section")
+    parser.add_argument("--blocks", type=int, default=200, help="Course blocks")
+    parser.add_argument("--repeats", type=int, default=3, help="Runs of each version to average")
+    args = parser.parse_args()
+
+    course_contents, blocks = build_course(args.sections, args.modules_per_section, args.blocks)
+    before_elapsed, before = time_run(legacy_normalization, course_contents, blocks, args.repeats)
+    after_elapsed, after = time_run(course_model_normalization, course_contents, blocks, args.repeats)
+
+    for name, before_frame, after_frame in zip(('sections', 'modules', 'blocks'), before, after):
+        pd.testing.assert_frame_equal(before_frame, after_frame, check_dtype=False)
+
+    print(f"{args.sections} sections, {args.sections * args.modules_per_section} modules, {args.blocks} blocks (outputs identical)")
+    print(f"  before (iterrows + pd.concat, apply): {before_elapsed * 1000:.1f} ms")
+    print(f"  after  (course_model, frames):         {after_elapsed * 1000:.1f} ms")
+    print(f"  speed up: {before_elapsed / after_elapsed:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+import os
+import time
+import json
+import argparse
+import httpx
+from dotenv import load_dotenv
+
+load_dotenv(override=True)
+
+from lib.moodle_rest import moodle_rest
+
+# The calls set_course makes for every course, repeated to mimic a large course harvest
+COURSE_FUNCTIONS = [
+    ('core_block_get_course_blocks', 'courseid'),
+    ('core_course_get_contents', 'courseid'),
+    ('mod_resource_get_resources_by_courses', 'courseids'),
+    ('mod_book_get_books_by_courses', 'courseids'),
+]
+
+
+def build_parameters(moodle_rest_connection, moodle_function, id_field, course_id):
+    course_arg = [course_id] if id_field == 'courseids' else course_id
+    parameters = dict(moodle_rest_connection.flatten_api_parameters({id_field: course_arg}))
+    parameters.update({
+        "wstoken": moodle_rest_connection.moodle_api_token,
+        "moodlewsrestformat": "json",
+        "wsfunction": moodle_function
+    })
+    return parameters
+
+
+def run_requests(get, moodle_rest_connection, course_id, repeats):
+    """Issue every COURSE_FUNCTIONS call `repeats` times through `get` and return requests per second"""
+    url = moodle_rest_connection.moodle_url + moodle_rest_connection.rest_endpoint
+    request_count = 0
+    start = time.perf_counter()
+    for _ in range(repeats):
+        for moodle_function, id_field in COURSE_FUNCTIONS:
+            parameters = build_parameters(moodle_rest_connection, moodle_function, id_field, course_id)
+            response = get(url, params=parameters, headers=moodle_rest_connection.headers, timeout=120)
+            response.raise_for_status()
+            response.json()
+            request_count += 1
+    elapsed = time.perf_counter() - start
+    return request_count, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare per-request httpx.get against the pooled moodle_rest client for one course."
+    )
+    parser.add_argument("--idnumber", type=str, help="Course idnumber to benchmark (defaults to the first IDNUMBER_LIST entry)")
+    parser.add_argument("--repeats", type=int, default=25, help="How many times to repeat the set_course calls")
+    args = parser.parse_args()
+
+    idnumber = args.idnumber
+    if idnumber is None:
+        idnumber_list = json.loads(os.getenv("IDNUMBER_LIST", "[]"))
+        if not idnumber_list:
+            print("Pass --idnumber or set IDNUMBER_LIST in .env")
+            return
+        idnumber = idnumber_list[0]
+
+    use_uat = os.getenv('USE_UAT', 'False').lower() in ['true', '1', 'yes']
+    with moodle_rest(use_uat=use_uat) as moodle_rest_connection:
+        course = moodle_rest_connection.get_course_by('idnumber', idnumber)
+        if course is None:
+            print(f"Course {idnumber} not found")
+            return
+        course_id = int(course['id'])
+
+        before_count, before_elapsed = run_requests(httpx.get, moodle_rest_connection, course_id, args.repeats)
+        after_count, after_elapsed = run_requests(moodle_rest_connection.http_client.get, moodle_rest_connection, course_id, args.repeats)
+
+    print(f"Course {idnumber} ({course_id}), {before_count} requests per mode")
+    print(f"  before (httpx.get, new connection per call): {before_count / before_elapsed:.1f} req/s ({before_elapsed:.1f}s)")
+    print(f"  after  (pooled keep-alive client):           {after_count / after_elapsed:.1f} req/s ({after_elapsed:.1f}s)")
+    print(f"  speed up: {before_elapsed / after_elapsed:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -34,7 +34,7 @@ class block_content:
         # Create resource lookup dictionary
         resource_lookup = {}
 
-        for _, resource in course_resources.iterrows():
+        for resource in course_resources.to_dict('records'):
             for file in resource.get('contentfiles', []):
                 if resource_id := self.content_utilities.extract_resource_id(file.get('fileurl', '')):
                     resource_lookup[resource_id] = {
@@ -50,7 +50,7 @@ class block_content:
                         'timemodified': file.get('timemodified')
                     }
         
-        for _, block in course_blocks.iterrows():
+        for block in course_blocks.to_dict('records'):
             block_data = {
                 'course_id': course_info.get('id'),
                 'course_name': course_info.get('shortname'),
@@ -3,42 +3,187 @@ import numpy as np
 import os
 from dotenv import load_dotenv
 import json
+import time
+import argparse
+import multiprocessing.util
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 load_dotenv(override=True)
 
 from lib.moodle_rest import moodle_rest
 from lib.moodle_content_helpers import moodle_content_helpers
+from lib.response_cache import response_cache
+from lib.event_logger import EventLogger
+from lib.image_store import image_store
 
-idnumber_search = os.getenv('IDNUMBER_SEARCH')
-idnumber_list = json.loads(os.getenv("IDNUMBER_LIST", "[]"))  
-idnumber_list = idnumber_list if isinstance(idnumber_list, list) else []
+# Each process (the main one, or a --workers pool process) holds its own connection and helpers
+moodle_rest_connection = None
+moodle_content_helper = None
 
-use_uat = os.getenv('USE_UAT', 'False').lower() in ['true', '1', 'yes']
 
-moodle_rest_connection = moodle_rest(use_uat=use_uat)
-moodle_content_helper = moodle_content_helpers(moodle_rest_connection)
+def create_connection(use_uat, cache_options, incremental=None, output_format=None, resume=False):
+    """Create this process's moodle_rest connection and content helpers"""
+    global moodle_rest_connection, moodle_content_helper
+    moodle_response_cache = None
+    if cache_options is not None:
+        moodle_response_cache = response_cache.from_env(**cache_options)
+    moodle_rest_connection = moodle_rest(use_uat=use_uat, response_cache=moodle_response_cache)
+    moodle_content_helper = moodle_content_helpers(moodle_rest_connection, incremental=incremental, output_format=output_format, resume=resume)
+    return moodle_rest_connection
 
-courses = moodle_rest_connection.get_courses()
 
-current_courses = pd.DataFrame()
+def close_connection():
+    """Shut down this process's helper thread pools and content store, then its connection"""
+    moodle_content_helper.close()
+    moodle_rest_connection.close()
 
-# Get lists courses first
-if idnumber_list is not None and idnumber_list != ['']:
-    current_courses = pd.concat([current_courses, moodle_rest_connection.get_matching_courses_from_list('idnumber', idnumber_list)], ignore_index=True)
 
-print(f"Found {len(current_courses)} courses from the course ids in idnumber_list provided.")
+def init_worker(use_uat, cache_options, incremental=None, output_format=None, resume=False):
+    """Process pool initializer: own event log file, connection and helpers per worker"""
+    EventLogger.log_filename = f"log_events_worker_{os.getpid()}.csv"
+    create_connection(use_uat, cache_options, incremental, output_format, resume)
+    # Pool workers skip atexit, but run multiprocessing finalizers when the pool shuts them down
+    multiprocessing.util.Finalize(None, close_connection, exitpriority=10)
 
-# Get search courses next
-if idnumber_search not in [None, '']:
-    current_courses = pd.concat([current_courses, moodle_rest_connection.get_matching_courses('idnumber', idnumber_search)], ignore_index=True)
 
-print(f"We now have a total of {len(current_courses)} courses including idnumbers and course ids.")
+def harvest_course(course_id, prefetched_items=None):
+    """set_course -> get_course_content -> save_course_data for one course, returns a result summary"""
+    start = time.perf_counter()
+    result = {'course_id': course_id, 'fullname': None, 'idnumber': None, 'error': None}
+    image_stats_before = Counter(image_store.get_shared().get_stats())
+    try:
+        if prefetched_items:
+            for moodle_function, items in prefetched_items.items():
+                moodle_rest_connection.prefetched_by_courses[moodle_function][course_id] = items
+        course, course_modules, course_sections, course_blocks, course_resources = moodle_content_helper.set_course(course_id)
+        result['fullname'] = course['fullname']
+        result['idnumber'] = course['idnumber']
+        print(f"\n\nCurrent Course: {course['fullname']}")
+        block_content, book_content, course_page_content, course_label_content, course_sections, course_file_content, course_folder_content, course_resources, course_urls, course_forums = moodle_content_helper.get_course_content(course, course_modules, course_sections, course_blocks, course_resources)
+        # todo make work all_files = moodle_content_helper.get_all_files(block_content, book_content, course_page_content, course_label_content, course_sections, course_file_content, course_folder_content, course_resources, course_urls, course_forums)
+        moodle_content_helper.save_course_data(course, course_sections, course_resources, block_content, book_content, course_file_content, course_folder_content, course_page_content, course_label_content, course_urls, course_forums)
+        moodle_content_helper.journal.complete_course(course_id, idnumber=result['idnumber'])
+    except Exception as e:
+        result['error'] = f"{type(e).__name__}: {str(e)}"
+        moodle_content_helper.journal.fail_course(course_id, result['error'])
+    finally:
+        # Prefetched items are normally taken by set_course, drop any a failed course left behind
+        for prefetched in moodle_rest_connection.prefetched_by_courses.values():
+            prefetched.pop(course_id, None)
+        EventLogger.flush_all()
+    result['elapsed'] = time.perf_counter() - start
+    # This course's embedded image counts, added up in the main process (workers have their own stores)
+    result['image_stats'] = dict(Counter(image_store.get_shared().get_stats()) - image_stats_before)
+    return result
 
-for _, current_course in current_courses.iterrows():
-    course, course_modules, course_sections, course_blocks, course_resources = moodle_content_helper.set_course(current_course['id'])
-    print(f"\n\nCurrent Course: {course['fullname']}")
-    block_content, book_content, course_page_content, course_label_content, course_sections, course_file_content, course_folder_content, course_resources, course_urls, course_forums = moodle_content_helper.get_course_content(course, course_modules, course_sections, course_blocks, course_resources)
-    # todo make work all_files = moodle_content_helper.get_all_files(block_content, book_content, course_page_content, course_label_content, course_sections, course_file_content, course_folder_content, course_resources, course_urls, course_forums)
-    moodle_content_helper.save_course_data(course, course_sections, course_resources, block_content, book_content, course_file_content, course_folder_content, course_page_content, course_label_content, course_urls, course_forums)
-    print(f"Saved data for {course['fullname']}")
 
+def get_prefetched_items(course_id):
+    """The prefetched *_by_courses items for one course, taken out of this process to hand to a worker process"""
+    return {
+        moodle_function: prefetched.pop(course_id)
+        for moodle_function, prefetched in moodle_rest_connection.prefetched_by_courses.items()
+        if course_id in prefetched
+    }
+
+
+def report_result(result, completed, total, failures, image_stats):
+    image_stats.update(result.get('image_stats', {}))
+    name = result['fullname'] or result['course_id']
+    if result['error']:
+        failures.append(result)
+        moodle_rest_connection.event_logger.log_data("harvest_course_error", f"Course {name}: {result['error']}")
+        print(f"[{completed}/{total}] FAILED {name} after {result['elapsed']:.1f}s: {result['error']}")
+    else:
+        print(f"[{completed}/{total}] Saved data for {name} ({result['elapsed']:.1f}s)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Harvest Moodle course content into course_data.")
+    parser.add_argument("--cache", action="store_true", help="Cache web-service responses on disk (also MOODLE_CACHE=True in .env)")
+    parser.add_argument("--refresh", action="store_true", help="Ignore cached responses but refresh the cache with new ones")
+    parser.add_argument("--offline", action="store_true", help="Only use cached responses, never call Moodle")
+    parser.add_argument("--cache-bypass", type=str, default="", help="Comma separated wsfunctions that are never cached")
+    parser.add_argument("--workers", type=int, default=int(os.getenv('HARVEST_WORKERS', '1')), help="Harvest courses in this many processes (default 1, serial)")
+    parser.add_argument("--incremental", action="store_true", default=None, help="Only fetch and clean modules changed since the last run (also MOODLE_INCREMENTAL=True in .env)")
+    parser.add_argument("--output-format", choices=["csv", "parquet", "jsonl"], default=None, help="Save course tables as CSV, Parquet or JSON Lines (also MOODLE_OUTPUT_FORMAT in .env, default csv)")
+    parser.add_argument("--resume", action="store_true", help="Skip courses and module stages the last run's journal records as finished")
+    args = parser.parse_args()
+
+    idnumber_search = os.getenv('IDNUMBER_SEARCH')
+    idnumber_list = json.loads(os.getenv("IDNUMBER_LIST", "[]"))
+    idnumber_list = idnumber_list if isinstance(idnumber_list, list) else []
+
+    use_uat = os.getenv('USE_UAT', 'False').lower() in ['true', '1', 'yes']
+
+    use_cache = args.cache or args.refresh or args.offline or os.getenv('MOODLE_CACHE', 'False').lower() in ['true', '1', 'yes']
+    cache_options = None
+    if use_cache:
+        bypass_functions = [name.strip() for name in args.cache_bypass.split(',') if name.strip()]
+        cache_options = {'refresh': args.refresh, 'offline': args.offline, 'bypass_functions': bypass_functions}
+
+    create_connection(use_uat, cache_options, args.incremental, args.output_format, args.resume)
+    journal = moodle_content_helper.journal
+    if not args.resume:
+        journal.reset()
+
+    current_courses = pd.DataFrame()
+
+    # Get lists courses first
+    if idnumber_list is not None and idnumber_list != ['']:
+        current_courses = pd.concat([current_courses, moodle_rest_connection.get_matching_courses_from_list('idnumber', idnumber_list)], ignore_index=True)
+
+    print(f"Found {len(current_courses)} courses from the course ids in idnumber_list provided.")
+
+    # Get search courses next
+    if idnumber_search not in [None, '']:
+        current_courses = pd.concat([current_courses, moodle_rest_connection.get_matching_courses('idnumber', idnumber_search)], ignore_index=True)
+
+    print(f"We now have a total of {len(current_courses)} courses including idnumbers and course ids.")
+
+    course_ids = [int(course_id) for course_id in current_courses['id']] if not current_courses.empty else []
+    # A course matched by both the list and the search is harvested once, two workers must never share its folder
+    course_ids = list(dict.fromkeys(course_ids))
+    if len(course_ids) < len(current_courses):
+        print(f"{len(current_courses) - len(course_ids)} courses were matched more than once, harvesting {len(course_ids)} unique courses.")
+    if args.resume:
+        remaining_course_ids = [course_id for course_id in course_ids if not journal.is_course_completed(course_id)]
+        print(f"Resuming: {len(course_ids) - len(remaining_course_ids)} courses already harvested, {len(remaining_course_ids)} to go")
+        course_ids = remaining_course_ids
+        journal.record('run_resumed', remaining=len(course_ids))
+
+    # Fetch module instances for all matched courses in a few batched calls
+    if course_ids:
+        moodle_rest_connection.prefetch_courses(course_ids)
+
+    failures = []
+    image_stats = Counter()
+    if args.workers > 1 and len(course_ids) > 1:
+        print(f"Harvesting {len(course_ids)} courses with {args.workers} worker processes")
+        with ProcessPoolExecutor(max_workers=args.workers, initializer=init_worker, initargs=(use_uat, cache_options, args.incremental, args.output_format, args.resume)) as executor:
+            futures = [executor.submit(harvest_course, course_id, get_prefetched_items(course_id)) for course_id in course_ids]
+            for completed, future in enumerate(as_completed(futures), start=1):
+                report_result(future.result(), completed, len(course_ids), failures, image_stats)
+    else:
+        for completed, course_id in enumerate(course_ids, start=1):
+            report_result(harvest_course(course_id), completed, len(course_ids), failures, image_stats)
+
+    print(f"\nHarvested {len(course_ids) - len(failures)} of {len(course_ids)} courses")
+    for failure in failures:
+        print(f"  Failed: {failure['fullname'] or failure['course_id']} - {failure['error']}")
+
+    print(image_store.get_shared().report(image_stats))
+    print(moodle_rest_connection.concurrency_limiter.report())
+    print(moodle_rest_connection.retry_budget.report())
+    if moodle_rest_connection.request_coalescer is not None:
+        print(moodle_rest_connection.request_coalescer.report())
+    if moodle_rest_connection.response_cache is not None:
+        print(moodle_rest_connection.response_cache.report())
+    if moodle_content_helper.content_store is not None:
+        print(moodle_content_helper.content_store.report())
+
+    close_connection()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+import os
+import time
+import threading
+
+
+class adaptive_limiter:
+    """
+    AIMD concurrency limiter for requests to Moodle.
+
+    The number of requests allowed in flight grows by one for every `limit` successful
+    requests (additive increase) and is halved when Moodle reports overload, e.g.
+    odbc_exec errors, 5xx responses or timeouts (multiplicative decrease). Repeated
+    overloads also pause new requests for an exponentially growing backoff, which
+    matters for serial runs where the limit is already 1.
+    """
+
+    def __init__(self, initial_limit: int = 4, min_limit: int = 1, max_limit: int = 32,
+                 decrease_factor: float = 0.5, base_backoff: float = 1.0, max_backoff: float = 60.0,
+                 decrease_cooldown: float = 2.0) -> None:
+        self.limit = float(initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.decrease_factor = decrease_factor
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.decrease_cooldown = decrease_cooldown  # One burst of errors only counts as one overload
+        self.in_flight = 0
+        self.backoff_delay = 0.0
+        self.backoff_until = 0.0
+        self.last_decrease = 0.0
+        self.overloads = 0
+        self.lowest_limit = self.limit
+        self.condition = threading.Condition()
+
+    @classmethod
+    def from_env(cls):
+        """Build a limiter from MOODLE_CONCURRENCY_* settings in .env"""
+        return cls(
+            initial_limit=int(os.getenv('MOODLE_CONCURRENCY_INITIAL', '4')),
+            min_limit=int(os.getenv('MOODLE_CONCURRENCY_MIN', '1')),
+            max_limit=int(os.getenv('MOODLE_CONCURRENCY_MAX', '32')),
+            max_backoff=float(os.getenv('MOODLE_MAX_BACKOFF', '60'))
+        )
+
+    def acquire(self) -> None:
+        with self.condition:
+            while True:
+                wait_for = self.backoff_until - time.monotonic()
+                if wait_for > 0:
+                    self.condition.wait(wait_for)
+                elif self.in_flight < int(self.limit):
+                    self.in_flight += 1
+                    return
+                else:
+                    self.condition.wait()
+
+    def release(self, overloaded: bool = False) -> None:
+        with self.condition:
+            self.in_flight -= 1
+            if overloaded:
+                self.on_overload()
+            else:
+                self.on_success()
+            self.condition.notify_all()
+
+    def on_success(self) -> None:
+        self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+        self.backoff_delay = self.backoff_delay / 2 if self.backoff_delay > self.base_backoff else 0.0
+
+    def on_overload(self) -> None:
+        now = time.monotonic()
+        if now - self.last_decrease < self.decrease_cooldown:
+            return
+        self.last_decrease = now
+        self.overloads += 1
+        self.limit = max(self.min_limit, self.limit * self.decrease_factor)
+        self.lowest_limit = min(self.lowest_limit, self.limit)
+        self.backoff_delay = min(self.max_backoff, max(self.base_backoff, self.backoff_delay * 2))
+        self.backoff_until = now + self.backoff_delay
+
+    def report(self) -> str:
+        return (f"Concurrency limiter: limit now {int(self.limit)} (lowest {int(self.lowest_limit)}, max {self.max_limit}), "
+                f"{self.overloads} overload back-offs")
+
+
+class retry_budget:
+    """
+    Token bucket limiting retries across all requests.
+
+    Every successful request earns `ratio` of a retry and every retry spends one, so
+    when Moodle is failing broadly retries stop instead of multiplying the load.
+    """
+
+    def __init__(self, ratio: float = 0.1, initial_tokens: float = 10.0, max_tokens: float = 100.0) -> None:
+        self.ratio = ratio
+        self.tokens = initial_tokens
+        self.max_tokens = max_tokens
+        self.retries = 0
+        self.refused = 0
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        """Build a retry budget from MOODLE_RETRY_BUDGET_* settings in .env"""
+        return cls(
+            ratio=float(os.getenv('MOODLE_RETRY_BUDGET_RATIO', '0.1')),
+            initial_tokens=float(os.getenv('MOODLE_RETRY_BUDGET_MIN', '10'))
+        )
+
+    def deposit(self) -> None:
+        with self.lock:
+            self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        """Spend one retry if the budget allows it"""
+        with self.lock:
+            if self.tokens >= 1:
+                self.tokens -= 1
+                self.retries += 1
+                return True
+            self.refused += 1
+            return False
+
+    def report(self) -> str:
+        return f"Retry budget: {self.retries} retries used, {self.refused} refused, {self.tokens:.1f} left"
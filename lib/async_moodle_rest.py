@@ -0,0 +1,60 @@
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Optional
+
+
+class AsyncMoodleRest:
+    """
+    Async counterpart of moodle_rest with a bounded number of requests in flight.
+
+    Each awaitable runs the matching moodle_rest call on a small thread pool, so
+    requests still go through the connection's response cache, request coalescer,
+    adaptive concurrency limiter, retry budget and pooled http client; at most
+    max_in_flight of them are open at a time.
+    """
+
+    def __init__(self, moodle_rest, max_in_flight: Optional[int] = None) -> None:
+        self.moodle_rest = moodle_rest
+        if max_in_flight is None:
+            max_in_flight = int(os.getenv('MOODLE_MAX_IN_FLIGHT', '16'))
+        self.max_in_flight = max_in_flight
+        self.semaphore = None  # Created on first use, in the running event loop
+        self.executor = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix='moodle_async')
+
+    async def run(self, function, *args, **kwargs):
+        """Run a moodle_rest call on the pool, waiting for a free in-flight slot first"""
+        if self.semaphore is None:
+            self.semaphore = asyncio.Semaphore(self.max_in_flight)
+        async with self.semaphore:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, lambda: function(*args, **kwargs))
+
+    async def close(self):
+        self.executor.shutdown(wait=True)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+        return False
+
+    async def get_moodle_rest_request(self, moodle_function: str, **kwargs) -> Dict[str, Any]:
+        """Awaitable get_moodle_rest_request, with the same caching, coalescing, limits and retries"""
+        return await self.run(self.moodle_rest.get_moodle_rest_request, moodle_function, **kwargs)
+
+    async def get_forum_discussions(self, forum_id, page=None, perpage=None):
+        return await self.run(self.moodle_rest.get_forum_discussions, forum_id, page=page, perpage=perpage)
+
+    async def get_forum_discussion_posts(self, discussion_id):
+        return await self.run(self.moodle_rest.get_forum_discussion_posts, discussion_id)
+
+    async def get_mod_books_in_course(self, course_id):
+        return await self.run(self.moodle_rest.get_mod_books_in_course, course_id)
+
+    async def get_moodle_web_file_content(self, moodle_file_url):
+        return await self.run(self.moodle_rest.get_moodle_web_file_content, moodle_file_url)
+
+    async def download_moodle_web_file(self, moodle_file_url, destination_path=None, max_bytes=None, content_type_prefix=None):
+        return await self.run(self.moodle_rest.download_moodle_web_file, moodle_file_url, destination_path, max_bytes, content_type_prefix)
@@ -0,0 +1,58 @@
+import os
+import json
+import time
+import hashlib
+from typing import Dict, Any, Optional
+
+
+class auth_store:
+    """
+    Mobile token and web-session cookies kept on disk between runs, per site and user.
+
+    The file and its directory are readable by the owner only and passwords are never
+    stored. Writes go to a temporary file that is renamed into place, so parallel
+    workers never see a half-written store.
+    """
+
+    def __init__(self, store_path: Optional[str] = None) -> None:
+        if store_path is None:
+            store_path = os.getenv('MOODLE_AUTH_STORE', os.path.expanduser('~/.cache/learning_tools_content_api/auth.json'))
+        self.store_path = os.path.expanduser(store_path)
+
+    def make_key(self, moodle_url: str, moodle_user: str) -> str:
+        return hashlib.sha256(f"{moodle_url}|{moodle_user}".encode('utf-8')).hexdigest()
+
+    def read_store(self) -> Dict[str, Any]:
+        try:
+            with open(self.store_path, encoding='utf-8') as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return {}
+
+    def load(self, moodle_url: str, moodle_user: str) -> Optional[Dict[str, Any]]:
+        """Saved auth for this site and user ({'mobile_token', 'cookies', 'saved'}), or None"""
+        return self.read_store().get(self.make_key(moodle_url, moodle_user))
+
+    def save(self, moodle_url: str, moodle_user: str, mobile_token: Optional[str] = None,
+             cookies: Optional[Dict[str, str]] = None) -> None:
+        store = self.read_store()
+        store[self.make_key(moodle_url, moodle_user)] = {
+            'mobile_token': mobile_token,
+            'cookies': cookies,
+            'saved': time.time()
+        }
+        self.write_store(store)
+
+    def forget(self, moodle_url: str, moodle_user: str) -> None:
+        store = self.read_store()
+        if store.pop(self.make_key(moodle_url, moodle_user), None) is not None:
+            self.write_store(store)
+
+    def write_store(self, store: Dict[str, Any]) -> None:
+        directory = os.path.dirname(self.store_path) or '.'
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        temp_path = f"{self.store_path}.{os.getpid()}.tmp"
+        file_descriptor = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(file_descriptor, 'w', encoding='utf-8') as file:
+            json.dump(store, file)
+        os.replace(temp_path, self.store_path)
@@ -7,6 +7,7 @@ from bs4 import BeautifulSoup
 import re
 from urllib.parse import urlparse, parse_qs
 from lib.event_logger import EventLogger
+from lib.image_store import image_store
 
 
 URL_PATTERN = re.compile(
@@ -17,6 +18,7 @@ URL_PATTERN = re.compile(
 class content_cleaners:
     def __init__(self) -> None:
         self.event_logger = EventLogger()
+        self.image_store = image_store.get_shared()
 
     def clean_text(self, text):
         import re
@@ -85,12 +87,14 @@ class content_cleaners:
                                     content_source: str, object_cmid: str, object_name: str, 
                                     item_id: str) -> str:
         """
-        Extract base64 embedded images, save them, and replace with localhost links.
+        Extract base64 embedded images, save them to the shared image store, and replace with localhost links.
+        Images are stored once by the hash of their bytes (see lib/image_store.py), however many
+        chapters or courses embed them.
         Logs any encountered non-image data: types.
         
         Args:
             html_content: HTML content containing embedded images
-            output_path: Base path for saving images (course_data/course_idnumber/)
+            output_path: Course folder (course_data/course_idnumber/), only used in log messages
             content_source: Source type (e.g., 'book', 'page', etc.)
             object_cmid: CMID of the content object
             object_name: Name of the content object
@@ -102,9 +106,6 @@ class content_cleaners:
         if not html_content:
             return html_content
             
-        # Create output directory if it doesn't exist
-        os.makedirs(output_path, exist_ok=True)
-        
         soup = BeautifulSoup(html_content, 'html.parser')
         
         # Track number of images in this chapter
@@ -134,25 +135,17 @@ class content_cleaners:
                 image_format, base64_data = match.groups()
                 image_count += 1
                 
-                # Clean object name for filename
-                clean_object_name = re.sub(r'[^\w\-_]', '_', object_name)
-                
-                # Generate filename
-                filename = f"{object_cmid}_{clean_object_name}_{item_id}_{image_count}.{image_format}"
-                filepath = os.path.join(output_path, filename)
-                
                 try:
-                    # Decode and save image
+                    # Decode and save image, unless the store already has these bytes
                     image_data = base64.b64decode(base64_data)
-                    with open(filepath, 'wb') as f:
-                        f.write(image_data)
+                    filepath = self.image_store.save(image_data, image_format)
                         
-                    # Replace base64 data with localhost link
-                    new_src = f"localhost://{output_path}/{filename}"
+                    # Replace base64 data with a localhost link to the stored image
+                    new_src = f"localhost://{filepath}"
                     img['src'] = new_src
                     
                 except Exception as e:
-                    error = f"Error processing image in {content_source} {object_name} cmid {object_cmid} chapter {item_id}: {str(e)}"
+                    error = f"Error processing image {image_count} in {content_source} {object_name} cmid {object_cmid} chapter {item_id} ({output_path}): {str(e)}"
                     self.event_logger.log_data(f'Error processing {content_source} embedded image', error)
                     continue
         
@@ -0,0 +1,200 @@
+import os
+import json
+import math
+import sqlite3
+import threading
+from typing import Any, Dict, Iterable, Iterator, List
+import pandas as pd
+from lib.stream_writer import csv_stream_writer, jsonl_stream_writer
+from lib.output_backends import TYPED_COLUMNS, TYPED_COLUMN_SUFFIXES, restore_csv_value
+
+# Database table for each course table save_course_data writes
+STORE_TABLES = {
+    'course': 'courses',
+    'sections': 'sections',
+    'modules': 'modules',
+    'books': 'chapters',
+    'blocks': 'blocks',
+    'pages': 'pages',
+    'labels': 'labels',
+    'files': 'files',
+    'folders': 'folders',
+    'urls': 'urls',
+    'forums': 'forum_posts',
+}
+
+# Columns indexed (once a table has them) for the site-wide questions asked most often
+INDEXED_COLUMNS = {
+    'courses': [['id']],
+    'modules': [['coursemodule']],
+    'chapters': [['book_cmid'], ['chapter_type', 'chapter_filesize']],
+    'files': [['file_cmid'], ['file_filesize']],
+    'folders': [['folder_cmid']],
+    'pages': [['page_cmid']],
+    'labels': [['label_cmid']],
+    'urls': [['url_cmid']],
+    'forum_posts': [['forum_cmid'], ['forum_discussion_discussion']],
+}
+
+BATCH_ROWS = 1000
+
+UNUSED_FILES_QUERY = """
+    SELECT courses.id AS course_id, courses.fullname AS course_fullname, chapters.course_idnumber,
+           chapters.book_name, chapters.chapter_title, chapters.chapter_filename AS filename,
+           chapters.chapter_filesize AS filesize, chapters.book_id, chapters.book_cmid, chapters.chapter_id
+    FROM chapters LEFT JOIN courses ON courses.course_idnumber = chapters.course_idnumber
+    WHERE chapters.chapter_type = 'file' AND CAST(chapters.chapter_filesize AS INTEGER) >= ?
+      AND COALESCE(CAST(chapters.is_used AS TEXT), '') NOT IN ('1', 'True', 'true')
+      AND chapters.course_idnumber LIKE ?
+    ORDER BY CAST(chapters.chapter_filesize AS INTEGER) DESC
+"""
+
+
+class content_store:
+    """
+    Optional single SQLite database of every harvested course, alongside the CSVs.
+
+    Each course table (sections, modules, book chapters, files, blocks, forum posts, ...)
+    goes into one database table holding the rows of all courses, tagged with the course
+    idnumber and indexed on the columns site-wide reports filter on. Columns are added as
+    new ones turn up, and a course's rows are replaced in a single transaction.
+    """
+
+    def __init__(self, store_path: str = 'course_data/content_store.sqlite') -> None:
+        self.store_path = store_path
+        self.lock = threading.Lock()
+        os.makedirs(os.path.dirname(store_path) or '.', exist_ok=True)
+        # Worker processes share the file, transactions are started explicitly
+        self.connection = sqlite3.connect(store_path, check_same_thread=False, timeout=60, isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+
+    @classmethod
+    def from_env(cls):
+        """The store if MOODLE_CONTENT_STORE is set in .env, otherwise None"""
+        if os.getenv('MOODLE_CONTENT_STORE', 'False').lower() not in ['true', '1', 'yes']:
+            return None
+        return cls(os.getenv('MOODLE_CONTENT_STORE_PATH', 'course_data/content_store.sqlite'))
+
+    def get_columns(self, table: str) -> List[str]:
+        return [row[1] for row in self.connection.execute(f"PRAGMA table_info({quote(table)})")]
+
+    def ensure_columns(self, table: str, columns: Iterable[str]) -> None:
+        """Create table, or add the columns it doesn't have yet, and its indexes (call inside a transaction)"""
+        existing = self.get_columns(table)
+        if not existing:
+            self.connection.execute(f"CREATE TABLE {quote(table)} (course_idnumber TEXT)")
+            self.connection.execute(f"CREATE INDEX {quote(f'{table}_course_idnumber')} ON {quote(table)} (course_idnumber)")
+            existing = ['course_idnumber']
+        for column in columns:
+            if column not in existing:
+                column_definition = f"{quote(column)} {get_column_type(column)}".strip()
+                self.connection.execute(f"ALTER TABLE {quote(table)} ADD COLUMN {column_definition}")
+                existing.append(column)
+        for index_columns in INDEXED_COLUMNS.get(table, []):
+            if all(column in existing for column in index_columns):
+                index_name = quote(f"{table}_{'_'.join(index_columns)}")
+                self.connection.execute(f"CREATE INDEX IF NOT EXISTS {index_name} ON {quote(table)} ({', '.join(quote(column) for column in index_columns)})")
+
+    def save_course(self, course_idnumber: str, tables: Dict[str, Any]) -> None:
+        """Replace a course's rows in every table with tables ({'books': DataFrame or csv_stream_writer, ...}), all or nothing"""
+        with self.lock:
+            self.connection.execute("BEGIN IMMEDIATE")
+            try:
+                for table, store_table in STORE_TABLES.items():
+                    if self.get_columns(store_table):
+                        self.connection.execute(f"DELETE FROM {quote(store_table)} WHERE course_idnumber = ?", (course_idnumber,))
+                    if table not in tables:
+                        continue
+                    for records in iter_record_batches(tables[table]):
+                        columns = list(dict.fromkeys(column for record in records for column in record))
+                        self.ensure_columns(store_table, columns)
+                        insert = (f"INSERT INTO {quote(store_table)} (course_idnumber, {', '.join(quote(column) for column in columns)}) "
+                                  f"VALUES (?, {', '.join('?' for _ in columns)})")
+                        self.connection.executemany(insert, (
+                            # Rows reused from CSV or read back from a streamed CSV may hold numbers as text
+                            [course_idnumber] + [to_sql_value(restore_csv_value(column, record.get(column))) for column in columns] for record in records
+                        ))
+                self.connection.execute("COMMIT")
+            except Exception:
+                self.connection.execute("ROLLBACK")
+                raise
+
+    def query(self, sql: str, parameters: Iterable[Any] = ()) -> pd.DataFrame:
+        with self.lock:
+            return pd.read_sql_query(sql, self.connection, params=tuple(parameters))
+
+    def get_unused_files(self, min_bytes: int = 1048576, idnumber_pattern: str = '%') -> pd.DataFrame:
+        """Unused book files of at least min_bytes across every course whose idnumber matches (SQL LIKE), largest first"""
+        if not self.get_columns('chapters'):
+            return pd.DataFrame()
+        return self.query(UNUSED_FILES_QUERY, (min_bytes, idnumber_pattern))
+
+    def get_table_counts(self) -> Dict[str, int]:
+        """Rows in each table that has been created"""
+        counts = {}
+        with self.lock:
+            for store_table in STORE_TABLES.values():
+                if self.get_columns(store_table):
+                    counts[store_table] = self.connection.execute(f"SELECT COUNT(*) FROM {quote(store_table)}").fetchone()[0]
+        return counts
+
+    def report(self) -> str:
+        counts = self.get_table_counts()
+        return f"Content store: {counts.get('courses', 0)} courses, {sum(counts.values())} rows in {self.store_path}"
+
+    def close(self) -> None:
+        with self.lock:
+            self.connection.close()
+
+
+def quote(identifier: str) -> str:
+    """An SQL identifier (table or CSV column name) in double quotes"""
+    return '"' + str(identifier).replace('"', '""') + '"'
+
+
+def get_column_type(column: str) -> str:
+    """
+    NUMERIC affinity for ids, sizes, times, counts and flags, so they compare and sort as numbers
+    whatever type they arrive as. Other columns have no declared type and keep what they are given.
+    """
+    return 'NUMERIC' if column in TYPED_COLUMNS or column.endswith(TYPED_COLUMN_SUFFIXES) else ''
+
+
+def to_sql_value(value: Any) -> Any:
+    """A value SQLite can store: missing values as NULL, nested ones (tags, files lists) as the text the CSV holds"""
+    if value is None or value is pd.NA or (isinstance(value, float) and math.isnan(value)):
+        return None
+    if isinstance(value, (bool, int, float, str, bytes)):
+        return value
+    if hasattr(value, 'item') and not isinstance(value, (list, tuple, dict, set)):
+        return to_sql_value(value.item())  # numpy scalars
+    return str(value)
+
+
+def iter_record_batches(item_to_save: Any) -> Iterator[List[Dict[str, Any]]]:
+    """Rows of a course table in batches, reading streamed tables back from their file a batch at a time"""
+    if isinstance(item_to_save, pd.DataFrame):
+        for start in range(0, len(item_to_save), BATCH_ROWS):
+            yield item_to_save.iloc[start:start + BATCH_ROWS].to_dict('records')
+    elif isinstance(item_to_save, pd.Series):
+        yield [item_to_save.to_dict()]
+    elif isinstance(item_to_save, dict):
+        yield [item_to_save]
+    elif isinstance(item_to_save, (csv_stream_writer, jsonl_stream_writer)):
+        # Still under its temporary name while save_course_data is writing the course
+        path = item_to_save.temp_path if os.path.exists(item_to_save.temp_path) else item_to_save.final_path
+        if not len(item_to_save) or not os.path.exists(path):
+            return
+        if isinstance(item_to_save, csv_stream_writer):
+            for chunk in pd.read_csv(path, chunksize=BATCH_ROWS):
+                yield chunk.to_dict('records')
+            return
+        with open(path, encoding='utf-8') as file:
+            records = []
+            for line in file:
+                records.append(json.loads(line))
+                if len(records) == BATCH_ROWS:
+                    yield records
+                    records = []
+            if records:
+                yield records
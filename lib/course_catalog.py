@@ -0,0 +1,167 @@
+import re
+from bisect import bisect_left
+from typing import Dict, List, Any, Iterable, Optional
+import pandas as pd
+
+# Characters that end the literal prefix of an IDNUMBER_SEARCH style pattern once '*' becomes '.*'
+PATTERN_SPECIAL_CHARACTERS = set('.^$*+?{}[]\\|()')
+# Quantifiers that make the character before them optional, so it can't be part of the prefix
+OPTIONAL_QUANTIFIERS = set('?*{')
+
+
+def get_literal_prefix(pattern: str) -> str:
+    """
+    Text every string matched by the regular expression starts with, '' if there is none.
+
+    >>> get_literal_prefix('RVC_BVETMED.*')
+    'RVC_BVETMED'
+    >>> get_literal_prefix('RVC_A?_2023.*')
+    'RVC_'
+    >>> get_literal_prefix('RVC.*|B.*')
+    ''
+    >>> get_literal_prefix('RVC_[A|B].*')
+    'RVC_'
+    """
+    # An alternation outside a character class can match strings without the prefix
+    in_class = False
+    escaped = False
+    for character in pattern:
+        if escaped:
+            escaped = False
+        elif character == '\\':
+            escaped = True
+        elif character == '[':
+            in_class = True
+        elif character == ']':
+            in_class = False
+        elif character == '|' and not in_class:
+            return ''
+
+    prefix = ''
+    for character in pattern:
+        if character in PATTERN_SPECIAL_CHARACTERS:
+            if character in OPTIONAL_QUANTIFIERS:
+                prefix = prefix[:-1]
+            break
+        prefix += character
+    return prefix
+
+
+class course_catalog:
+    """
+    Course records with hash indexes on id, idnumber and shortname.
+
+    Exact lookups are dictionary hits, batches of values resolve in one pass, and
+    wildcard searches ('*2023_4*', 'RVC_BVETMED*') narrow candidates with a sorted
+    prefix index before applying the same regular expression get_matching_courses
+    always used.
+    """
+
+    INDEXED_FIELDS = ('id', 'idnumber', 'shortname')
+
+    def __init__(self, courses: Optional[Iterable[Dict[str, Any]]] = None) -> None:
+        self.courses = []
+        self.indexes = {field: {} for field in self.INDEXED_FIELDS}
+        self.sorted_values = {}  # field -> sorted [(value, position)], built on first wildcard search
+        self.series_cache = {}
+        self.frame = None
+        if courses:
+            self.add_courses(courses)
+
+    def __len__(self) -> int:
+        return len(self.courses)
+
+    def add_courses(self, courses: Iterable[Dict[str, Any]]) -> None:
+        """Add or replace (by id) course records and update the indexes"""
+        for course in courses:
+            existing = self.indexes['id'].get(course.get('id'))
+            if existing:
+                position = existing[0]
+                for field in self.INDEXED_FIELDS:
+                    positions = self.indexes[field].get(self.courses[position].get(field), [])
+                    if position in positions:
+                        positions.remove(position)
+                self.courses[position] = course
+                self.series_cache.pop(position, None)
+            else:
+                position = len(self.courses)
+                self.courses.append(course)
+            for field in self.INDEXED_FIELDS:
+                self.indexes[field].setdefault(course.get(field), []).append(position)
+        self.sorted_values.clear()
+        self.frame = None
+
+    def contains(self, field: str, value: Any) -> bool:
+        return bool(self.indexes[field].get(value))
+
+    def lookup(self, field: str, value: Any) -> List[Dict[str, Any]]:
+        """All courses whose field equals value"""
+        if field in self.indexes:
+            return [self.courses[position] for position in self.indexes[field].get(value, [])]
+        return [course for course in self.courses if course.get(field) == value]
+
+    def lookup_many(self, field: str, values: Iterable[Any]) -> List[Dict[str, Any]]:
+        """Courses matching any of values, in the order of values, one dictionary hit per value"""
+        if field not in self.indexes:
+            wanted = set(values)
+            return [course for course in self.courses if course.get(field) in wanted]
+        index = self.indexes[field]
+        seen_positions = set()
+        matches = []
+        for value in values:
+            for position in index.get(value, []):
+                if position not in seen_positions:
+                    seen_positions.add(position)
+                    matches.append(self.courses[position])
+        return matches
+
+    def match(self, field: str, value: str) -> List[Dict[str, Any]]:
+        """
+        Courses whose field matches a '*' wildcard pattern (same semantics as pandas str.match)
+
+        >>> catalog = course_catalog([{'id': 1, 'idnumber': 'RVC_A_2023_4'}, {'id': 2, 'idnumber': 'RVC__2023_4'}, {'id': 3, 'idnumber': 'BVM_2023_4'}])
+        >>> [course['id'] for course in catalog.match('idnumber', 'RVC_A?_2023*')]
+        [1, 2]
+        >>> [course['id'] for course in catalog.match('idnumber', 'RVC*|B*')]
+        [1, 2, 3]
+        """
+        pattern = value.replace("*", ".*")
+        compiled = re.compile(pattern)
+        prefix = get_literal_prefix(pattern)
+
+        if field not in self.indexes:
+            return [course for course in self.courses
+                    if isinstance(course.get(field), str) and compiled.match(course[field])]
+
+        sorted_values = self.get_sorted_values(field)
+        start = bisect_left(sorted_values, (prefix,)) if prefix else 0
+        positions = []
+        for index_value, position in sorted_values[start:]:
+            if prefix and not index_value.startswith(prefix):
+                break
+            if compiled.match(index_value):
+                positions.append(position)
+        return [self.courses[position] for position in sorted(positions)]
+
+    def get_sorted_values(self, field: str) -> List[tuple]:
+        if field not in self.sorted_values:
+            self.sorted_values[field] = sorted(
+                (value, position)
+                for value, positions in self.indexes[field].items() if isinstance(value, str)
+                for position in positions
+            )
+        return self.sorted_values[field]
+
+    def get_series(self, course: Dict[str, Any]) -> pd.Series:
+        """Course as a pandas Series (what callers of get_course expect), cached per course"""
+        position = self.indexes['id'][course.get('id')][0]
+        if position not in self.series_cache:
+            self.series_cache[position] = pd.Series(course)
+        return self.series_cache[position]
+
+    def to_dataframe(self, courses: Optional[List[Dict[str, Any]]] = None) -> pd.DataFrame:
+        if courses is not None:
+            return pd.DataFrame(courses)
+        if self.frame is None:
+            self.frame = pd.DataFrame(self.courses)
+        return self.frame
@@ -0,0 +1,161 @@
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Optional
+import pandas as pd
+
+
+class api_record:
+    """
+    Thin view of a dict from the API: dict-style access to the dict itself, so code written
+    against DataFrame rows or dicts keeps working and no field is copied.
+    """
+    __slots__ = ('raw',)
+
+    def __init__(self, raw: Dict[str, Any]) -> None:
+        self.raw = raw
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return self.raw.get(key, default)
+
+    def __getitem__(self, key: str) -> Any:
+        return self.raw[key]
+
+    def to_dict(self) -> Dict[str, Any]:
+        """The record as the API returned it"""
+        return dict(self.raw)
+
+
+class course_module(api_record):
+    """A course activity from core_course_get_contents, viewed with the id of its section"""
+    __slots__ = ('section_id',)
+
+    def __init__(self, raw: Dict[str, Any], section_id: Optional[int]) -> None:
+        super().__init__(raw)
+        self.section_id = section_id
+
+    def get(self, key: str, default: Any = None) -> Any:
+        if key == 'section_id':
+            return self.section_id
+        return self.raw.get(key, default)
+
+
+class course_section(api_record):
+    """A course section from core_course_get_contents, its modules viewed as course_module records"""
+    __slots__ = ('modules',)
+
+    def __init__(self, raw: Dict[str, Any]) -> None:
+        super().__init__(raw)
+        self.modules = [course_module(module, raw.get('id')) for module in raw.get('modules') or []]
+
+    def to_dict(self) -> Dict[str, Any]:
+        """The section as the API returned it, without its modules"""
+        return {key: value for key, value in self.raw.items() if key != 'modules'}
+
+
+@dataclass
+class content_item:
+    """
+    One processed item of a module (a book chapter's index.html or one of its files).
+
+    Module fields are shared with the other items of the module rather than copied into
+    each item, and the prefixed output row is only built by to_record.
+    """
+    __slots__ = ('item_id', 'filename', 'item_type', 'title', 'filepath', 'filesize', 'fileurl', 'time_modified',
+                 'sortorder', 'tags', 'item_url', 'module_data', 'processed', 'is_used')
+    item_id: Optional[int]
+    filename: str
+    item_type: str
+    title: Any
+    filepath: Optional[str]
+    filesize: Any
+    fileurl: str
+    time_modified: Any
+    sortorder: Any
+    tags: Any
+    item_url: Optional[str]
+    module_data: Dict[str, Any]
+    processed: Optional[Dict[str, str]]
+    is_used: Optional[bool]
+
+    RECORD_FIELDS = ('id', 'filename', 'type', 'files', 'title', 'filepath', 'filesize', 'fileurl', 'time_modified', 'sortorder', 'tags')
+    CONTENT_FIELDS = ('content', 'clean_html', 'cleanest_html', 'clean_text')
+
+    @classmethod
+    def from_record(cls, record: Dict[str, Any], component_name: str, module_data: Dict[str, Any]) -> 'content_item':
+        """Rebuild an item from a previously saved output row"""
+        values = {field: record.get(f'{component_name}_{field}') for field in cls.RECORD_FIELDS}
+        processed = {field: record[field] for field in cls.CONTENT_FIELDS if record.get(field, '') != ''}
+        return cls(values['id'], values['filename'], values['type'], values['title'], values['filepath'],
+                   values['filesize'], values['fileurl'], values['time_modified'], values['sortorder'], values['tags'],
+                   record.get(f'{component_name}_url'), module_data, processed or None, None)
+
+    def to_record(self, component_name: str) -> Dict[str, Any]:
+        """The output row, with fields prefixed by the component name (e.g. chapter_filename)"""
+        record = {
+            f'{component_name}_id': self.item_id,
+            f'{component_name}_filename': self.filename,
+            f'{component_name}_type': self.item_type,
+            f'{component_name}_files': [],
+            f'{component_name}_title': self.title,
+            f'{component_name}_filepath': self.filepath,
+            f'{component_name}_filesize': self.filesize,
+            f'{component_name}_fileurl': self.fileurl,
+            f'{component_name}_time_modified': self.time_modified,
+            f'{component_name}_sortorder': self.sortorder,
+            f'{component_name}_tags': self.tags,
+        }
+        if self.item_url is not None:
+            record[f'{component_name}_url'] = self.item_url
+        record.update(self.module_data)
+        if self.processed:
+            record.update(self.processed)
+        if self.is_used is not None:
+            record['is_used'] = self.is_used
+        return record
+
+
+class course_model:
+    """A course's sections and modules, with DataFrames only built when output needs them"""
+
+    def __init__(self) -> None:
+        self.sections = []
+        self.modules = []
+        self.modules_by_type = {}
+        self.sections_frame = None
+        self.modules_frame = None
+
+    @classmethod
+    def from_contents(cls, course_contents: Iterable[Dict[str, Any]]) -> 'course_model':
+        model = cls()
+        for course_section in course_contents:
+            model.add_section(course_section)
+        return model
+
+    def add_section(self, section: Dict[str, Any]) -> None:
+        new_section = course_section(section)
+        self.sections.append(new_section)
+        self.modules.extend(new_section.modules)
+        for module in new_section.modules:
+            self.modules_by_type.setdefault(module.get('modname'), []).append(module)
+        self.sections_frame = None
+        self.modules_frame = None
+
+    def get_modules(self, modname: Optional[str] = None) -> List[course_module]:
+        return self.modules if modname is None else self.modules_by_type.get(modname, [])
+
+    def get_sections_frame(self) -> pd.DataFrame:
+        if self.sections_frame is None:
+            self.sections_frame = pd.DataFrame([section.to_dict() for section in self.sections])
+        return self.sections_frame
+
+    def get_modules_frame(self) -> pd.DataFrame:
+        if self.modules_frame is None:
+            self.modules_frame = modules_to_dataframe(self.modules)
+        return self.modules_frame
+
+
+def modules_to_dataframe(modules: Iterable[course_module]) -> pd.DataFrame:
+    """course_module records as the modules DataFrame (API columns then section_id)"""
+    modules = list(modules)
+    modules_frame = pd.DataFrame([module.to_dict() for module in modules])
+    modules_frame['section_id'] = [module.section_id for module in modules]
+    return modules_frame
@@ -0,0 +1,19 @@
+from typing import Any, Dict, List
+import pandas as pd
+
+
+def normalize_course_blocks(blocks: List[Dict[str, Any]]) -> pd.DataFrame:
+    """core_block_get_course_blocks blocks with block_title and block_text taken from their configs in one pass"""
+    course_blocks = pd.DataFrame(blocks)
+    titles = []
+    texts = []
+    for configs in course_blocks.get('configs', pd.Series([None] * len(course_blocks))):
+        config_values = {}
+        if isinstance(configs, (list, tuple)):
+            for config in configs:
+                config_values.setdefault(config.get('name'), config.get('value'))
+        titles.append(config_values.get('title'))
+        texts.append(config_values.get('text'))
+    course_blocks['block_title'] = titles
+    course_blocks['block_text'] = texts
+    return course_blocks
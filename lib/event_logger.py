@@ -3,8 +3,13 @@ import csv
 from datetime import datetime
 from collections import deque
 import atexit
+import threading
 
 class EventLogger:
+    log_filename = "log_events.csv"  # Worker processes switch this to their own file
+    write_lock = threading.Lock()  # Loggers on extraction threads share the file
+    loggers = []  # Every logger in this process (atexit holds them anyway), for flush_all
+
     def __init__(self):
         """
         Initialize the event logger with an output directory and a deque to store events.
@@ -13,7 +18,7 @@ class EventLogger:
             output_dir (str): Directory path where log_events.csv will be stored
         """
         self.output_dir = 'course_data/'
-        self.log_file = os.path.join(self.output_dir, "log_events.csv")
+        self.log_file = os.path.join(self.output_dir, self.log_filename)
         self.events = deque(maxlen=100)  # Only keep last 100 events in memory
         
         # Create output directory if it doesn't exist
@@ -29,6 +34,7 @@ class EventLogger:
         
         # Register the flush_events method to run at program termination
         atexit.register(self.flush_events)
+        self.loggers.append(self)
     
     def log_data(self, event_title, event_details):
         """
@@ -52,9 +58,20 @@ class EventLogger:
         """
         if not self.events:
             return
-            
-        with open(self.log_file, 'a', newline='') as f:
-            writer = csv.writer(f)
-            writer.writerows(self.events)
-        
-        self.events.clear()
\ No newline at end of file
+
+        with self.write_lock:
+            events = []
+            while self.events:
+                events.append(self.events.popleft())
+            with open(self.log_file, 'a', newline='') as f:
+                writer = csv.writer(f)
+                writer.writerows(events)
+
+    @classmethod
+    def flush_all(cls):
+        """
+        Flush every logger in this process. Worker processes of a pool never run atexit,
+        so they call this once each course is done.
+        """
+        for logger in list(cls.loggers):
+            logger.flush_events()
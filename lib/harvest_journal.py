@@ -0,0 +1,109 @@
+import os
+import json
+import time
+import pickle
+import shutil
+import threading
+from typing import Any, Dict, Optional
+
+
+class harvest_journal:
+    """
+    Append-only record of completed courses and module-type stages.
+
+    Each event is one JSON line written with a single O_APPEND write, so worker processes
+    can share the file and a crash loses at most the line being written. With save_stages,
+    stage outputs are also pickled to a staging folder so --resume can pick a course up
+    part way through.
+    """
+
+    def __init__(self, journal_path: Optional[str] = None, save_stages: Optional[bool] = None) -> None:
+        if journal_path is None:
+            journal_path = os.getenv('HARVEST_JOURNAL', 'course_data/.journal/harvest_journal.jsonl')
+        if save_stages is None:
+            save_stages = os.getenv('HARVEST_JOURNAL_STAGES', 'False').lower() in ['true', '1', 'yes']
+        self.journal_path = journal_path
+        self.save_stages = save_stages  # Whether finished stages are snapshotted for --resume
+        self.staging_path = os.path.join(os.path.dirname(journal_path) or '.', 'staging')
+        self.completed_courses = set()
+        self.completed_stages = {}  # course_id -> set of stage names
+        self.failed_courses = {}  # course_id -> last error
+        self.lock = threading.Lock()
+        self.load()
+
+    def load(self) -> None:
+        self.completed_courses.clear()
+        self.completed_stages.clear()
+        self.failed_courses.clear()
+        try:
+            with open(self.journal_path, encoding='utf-8') as file:
+                for line in file:
+                    try:
+                        self.apply(json.loads(line))
+                    except ValueError:
+                        continue  # A line cut short by a crash
+        except OSError:
+            pass
+
+    def reset(self) -> None:
+        """Start a new run: forget the previous journal and any staged stage outputs"""
+        shutil.rmtree(self.staging_path, ignore_errors=True)
+        if os.path.exists(self.journal_path):
+            os.remove(self.journal_path)
+        self.load()
+        self.record('run_started')
+
+    def apply(self, entry: Dict[str, Any]) -> None:
+        course_id = entry.get('course_id')
+        if entry['event'] == 'stage_completed':
+            self.completed_stages.setdefault(course_id, set()).add(entry['stage'])
+        elif entry['event'] == 'course_completed':
+            self.completed_courses.add(course_id)
+            self.failed_courses.pop(course_id, None)
+            self.completed_stages.pop(course_id, None)
+        elif entry['event'] == 'course_failed':
+            self.failed_courses[course_id] = entry.get('error')
+
+    def record(self, event: str, course_id: Optional[int] = None, **details: Any) -> None:
+        entry = dict(details, event=event, course_id=course_id, time=time.time(), pid=os.getpid())
+        line = (json.dumps(entry, default=str) + "\n").encode('utf-8')
+        with self.lock:
+            os.makedirs(os.path.dirname(self.journal_path) or '.', exist_ok=True)
+            file_descriptor = os.open(self.journal_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(file_descriptor, line)
+                os.fsync(file_descriptor)
+            finally:
+                os.close(file_descriptor)
+            self.apply(entry)
+
+    def is_course_completed(self, course_id: int) -> bool:
+        return course_id in self.completed_courses
+
+    def get_stage_path(self, course_id: int, stage: str) -> str:
+        return os.path.join(self.staging_path, str(course_id), f"{stage}.pkl")
+
+    def is_stage_completed(self, course_id: int, stage: str) -> bool:
+        return stage in self.completed_stages.get(course_id, set()) and os.path.exists(self.get_stage_path(course_id, stage))
+
+    def save_stage(self, course_id: int, stage: str, output: Any) -> None:
+        """Stage the output of a finished stage, then journal it"""
+        stage_path = self.get_stage_path(course_id, stage)
+        os.makedirs(os.path.dirname(stage_path), exist_ok=True)
+        temp_path = f"{stage_path}.{os.getpid()}.tmp"
+        with open(temp_path, 'wb') as file:
+            pickle.dump(output, file)
+        os.replace(temp_path, stage_path)
+        self.record('stage_completed', course_id, stage=stage)
+
+    def load_stage(self, course_id: int, stage: str) -> Any:
+        with open(self.get_stage_path(course_id, stage), 'rb') as file:
+            return pickle.load(file)
+
+    def complete_course(self, course_id: int, **details: Any) -> None:
+        """Journal a course whose output files are committed, and drop its staged stages"""
+        self.record('course_completed', course_id, **details)
+        shutil.rmtree(os.path.join(self.staging_path, str(course_id)), ignore_errors=True)
+
+    def fail_course(self, course_id: int, error: str) -> None:
+        self.record('course_failed', course_id, error=error)
@@ -0,0 +1,137 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from typing import Dict, Any, Optional, Callable
+from lib.output_backends import read_rows
+
+# The save_course_data table each module type's rows end up in (forum rows are posts, keyed by discussion)
+MODTYPE_TABLES = {
+    'book': 'books',
+    'page': 'pages',
+    'label': 'labels',
+    'resource': 'files',
+    'folder': 'folders',
+    'url': 'urls',
+    'forum': 'forums',
+}
+
+
+class harvest_manifest:
+    """
+    Per-course record of what the last harvest saw, written next to the course CSVs.
+
+    Every module and chapter/file entry is stored with its timemodified, filesize and a
+    hash of the raw core_course_get_contents entry, and every forum discussion with its
+    modification times and reply count. On the next run unchanged entries reuse their
+    rows from the previous CSV instead of being fetched and cleaned again, and entries
+    that disappeared are kept as tombstones.
+    """
+
+    def __init__(self, data_store_path: str, course_idnumber: str) -> None:
+        self.course_idnumber = course_idnumber
+        self.manifest_path = os.path.join(data_store_path, course_idnumber, f"{course_idnumber}_manifest.json")
+        self.course_path = os.path.join(data_store_path, course_idnumber)
+        self.previous = self.load()
+        self.entries = {}
+        self.tombstones = list(self.previous.get('tombstones', []))
+        self.previous_rows = {}  # modtype -> {key: row, or list of rows when grouped}
+        self.seen_modtypes = set()
+        self.reused = 0
+        self.processed = 0
+        self.lock = threading.Lock()
+
+    def load(self) -> Dict[str, Any]:
+        try:
+            with open(self.manifest_path, encoding='utf-8') as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return {}
+
+    def is_enabled_for(self, modtype: str) -> bool:
+        return modtype in MODTYPE_TABLES
+
+    def make_key(self, modtype: str, cmid: Any, item_key: Optional[Any] = None) -> str:
+        """Key of a module, or of one of its items (a file url, a discussion id)"""
+        return f"{modtype}:{cmid}" if item_key is None else f"{modtype}:{cmid}:{item_key}"
+
+    def fingerprint(self, content: Any) -> Dict[str, Any]:
+        """timemodified, filesize and content hash of a raw contents entry (or a module's content field)"""
+        entries = content if isinstance(content, list) else [content]
+        timemodified = [entry.get('timemodified') for entry in entries if isinstance(entry, dict) and entry.get('timemodified')]
+        filesize = [entry.get('filesize') for entry in entries if isinstance(entry, dict) and entry.get('filesize') is not None]
+        return {
+            'timemodified': max(timemodified) if timemodified else None,
+            'filesize': sum(filesize) if filesize else None,
+            'hash': hashlib.sha256(json.dumps(content, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+        }
+
+    def load_previous_rows(self, modtype: str, row_key: Callable[[Dict[str, Any]], str],
+                           grouped: bool = False) -> Dict[str, Any]:
+        """
+        Rows of the previous run's table (CSV or Parquet) for this module type by key, read once per course.
+        With grouped, each key maps to the list of its rows (e.g. the posts of a discussion).
+        """
+        with self.lock:
+            self.seen_modtypes.add(modtype)
+            if modtype not in self.previous_rows:
+                rows = {}
+                try:
+                    # Typed like fresh rows (CSV text is restored), so reused and new rows don't mix types in a column
+                    previous_rows = read_rows(self.course_path, MODTYPE_TABLES[modtype], keep_types=True)
+                except FileNotFoundError:
+                    previous_rows = []
+                for row in previous_rows:
+                    if grouped:
+                        rows.setdefault(row_key(row), []).append(row)
+                    else:
+                        rows[row_key(row)] = row
+                self.previous_rows[modtype] = rows
+            return self.previous_rows[modtype]
+
+    def get_unchanged_row(self, modtype: str, key: str, fingerprint: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """A copy of the previous row (or grouped rows) for key if its fingerprint has not changed, otherwise None"""
+        previous_entry = self.previous.get('entries', {}).get(key)
+        row = self.previous_rows.get(modtype, {}).get(key)
+        if previous_entry is None or row is None or previous_entry.get('hash') != fingerprint['hash']:
+            return None
+        return [dict(grouped_row) for grouped_row in row] if isinstance(row, list) else dict(row)
+
+    def record(self, modtype: str, key: str, fingerprint: Dict[str, Any], reused: bool) -> None:
+        with self.lock:
+            self.entries[key] = dict(fingerprint, modtype=modtype)
+            if reused:
+                self.reused += 1
+            else:
+                self.processed += 1
+
+    def get_deleted_keys(self):
+        """Keys from the previous run, of module types harvested this run, that are gone now"""
+        return [
+            key for key, entry in self.previous.get('entries', {}).items()
+            if entry.get('modtype') in self.seen_modtypes and key not in self.entries
+        ]
+
+    def save(self) -> None:
+        """Write the manifest for this run, adding tombstones for deleted entries"""
+        previous_entries = self.previous.get('entries', {})
+        deleted_time = time.time()
+        deleted_keys = self.get_deleted_keys()
+        for key in deleted_keys:
+            self.tombstones.append(dict(previous_entries[key], key=key, deleted=deleted_time))
+        # Entries of module types not harvested this run carry over unchanged
+        entries = {key: entry for key, entry in previous_entries.items() if entry.get('modtype') not in self.seen_modtypes}
+        entries.update(self.entries)
+        manifest = {
+            'course_idnumber': self.course_idnumber,
+            'saved': deleted_time,
+            'entries': entries,
+            'tombstones': self.tombstones
+        }
+        os.makedirs(os.path.dirname(self.manifest_path), exist_ok=True)
+        temp_path = f"{self.manifest_path}.{os.getpid()}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as file:
+            json.dump(manifest, file)
+        os.replace(temp_path, self.manifest_path)
+        print(f"Incremental harvest: {self.reused} unchanged, {self.processed} new or changed, {len(deleted_keys)} deleted")
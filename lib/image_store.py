@@ -0,0 +1,65 @@
+import os
+import hashlib
+import threading
+from collections import Counter
+from typing import Dict, Optional
+
+
+class image_store:
+    """
+    Content-addressed store for images extracted from embedded (base64) HTML.
+
+    Each image is saved once as <store_path>/<sha256[:2]>/<sha256>.<format>, keyed by the hash
+    of its decoded bytes, and shared by every chapter, page and course that embeds it, so the
+    same logo or diagram is only ever written once however many times it is embedded.
+    """
+    shared_store = None
+    shared_lock = threading.Lock()
+
+    def __init__(self, store_path: str = 'course_data/images/') -> None:
+        self.store_path = store_path
+        self.lock = threading.Lock()
+        self.stats = Counter()  # images, stored, duplicates, bytes_stored, bytes_saved
+
+    @classmethod
+    def get_shared(cls) -> 'image_store':
+        """This process's store, at MOODLE_IMAGE_STORE_PATH"""
+        with cls.shared_lock:
+            if cls.shared_store is None:
+                cls.shared_store = cls(os.getenv('MOODLE_IMAGE_STORE_PATH', 'course_data/images/'))
+            return cls.shared_store
+
+    def get_path(self, digest: str, image_format: str) -> str:
+        return os.path.join(self.store_path, digest[:2], f"{digest}.{image_format.lower()}")
+
+    def save(self, image_data: bytes, image_format: str) -> str:
+        """Path of the stored image, writing it only if these bytes aren't stored yet"""
+        digest = hashlib.sha256(image_data).hexdigest()
+        path = self.get_path(digest, image_format)
+        if os.path.exists(path):
+            self.count(duplicates=1, bytes_saved=len(image_data))
+            return path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Another thread or worker process may store the same image at the same time, the rename makes that harmless
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp_path, 'wb') as file:
+            file.write(image_data)
+        os.replace(temp_path, path)
+        self.count(stored=1, bytes_stored=len(image_data))
+        return path
+
+    def count(self, **counts: int) -> None:
+        with self.lock:
+            self.stats['images'] += 1
+            self.stats.update(counts)
+
+    def get_stats(self) -> Dict[str, int]:
+        with self.lock:
+            return dict(self.stats)
+
+    def report(self, stats: Optional[Dict[str, int]] = None) -> str:
+        """Summary of stats (this store's by default, or ones added up from worker processes)"""
+        stats = Counter(stats if stats is not None else self.get_stats())
+        return (f"Embedded images: {stats['images']} found, {stats['stored']} stored "
+                f"({stats['bytes_stored'] / (1024 * 1024):.1f} MB), {stats['duplicates']} already in {self.store_path} "
+                f"({stats['bytes_saved'] / (1024 * 1024):.1f} MB not written again)")
@@ -0,0 +1,90 @@
+import json
+import itertools
+from typing import Iterable, Iterator, Any
+
+
+def iter_json_array(text_chunks: Iterable[str]) -> Iterator[Any]:
+    """
+    Yield the elements of a top-level JSON array as the text arrives.
+
+    Only the text of the element being decoded is buffered, never the whole response
+    text. Callers that keep every element (load_json_stream) still hold the whole
+    decoded value. If the top-level value is not an array (e.g. a Moodle exception
+    object) it is yielded whole.
+    """
+    decoder = json.JSONDecoder()
+    chunks = iter(text_chunks)
+    buffer = ''
+    position = 0
+    exhausted = False
+
+    def read_more(minimum_length: int = 0) -> bool:
+        """Append chunks until the buffer reaches minimum_length (at least one chunk), False at end of stream"""
+        nonlocal buffer, exhausted
+        added = False
+        for chunk in chunks:
+            if chunk:
+                buffer += chunk
+                added = True
+                if len(buffer) >= minimum_length:
+                    return True
+        exhausted = True
+        return added
+
+    def skip(characters: str) -> bool:
+        nonlocal position
+        while True:
+            while position < len(buffer) and (buffer[position].isspace() or buffer[position] in characters):
+                position += 1
+            if position < len(buffer):
+                return True
+            if not read_more():
+                return False
+
+    if not skip(''):
+        return
+    if buffer[position] != '[':
+        while read_more():
+            pass
+        yield json.loads(buffer[position:])
+        return
+    position += 1
+
+    while True:
+        if not skip(','):
+            raise ValueError("Unexpected end of JSON array")
+        if buffer[position] == ']':
+            return
+        while True:
+            try:
+                item, end = decoder.raw_decode(buffer, position)
+                # A number or literal at the end of the buffer may still be incomplete
+                if end < len(buffer) or exhausted or isinstance(item, (dict, list, str)):
+                    break
+            except json.JSONDecodeError:
+                if exhausted:
+                    raise
+            # Grow geometrically so a large element is re-decoded O(log n) times, not once per chunk
+            read_more(len(buffer) + (len(buffer) - position))
+        yield item
+        buffer = buffer[end:]
+        position = 0
+
+
+def load_json_stream(text_chunks: Iterable[str]) -> Any:
+    """
+    The JSON value of a response decoded as its text arrives. A top-level array is decoded
+    element by element, so the whole response text is never held alongside the decoded
+    value, which lowers peak memory while parsing; the decoded value itself is still
+    complete in memory. Anything else (e.g. a Moodle exception object) is decoded whole.
+    """
+    chunks = iter(text_chunks)
+    head = ''
+    for chunk in chunks:
+        head += chunk
+        if head.strip():
+            break
+    text_chunks = itertools.chain([head], chunks)
+    if head.lstrip().startswith('['):
+        return list(iter_json_array(text_chunks))
+    return json.loads(''.join(text_chunks))
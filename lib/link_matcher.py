@@ -0,0 +1,105 @@
+from collections import deque
+from typing import Dict, Iterable, Iterator, List, Set, Tuple
+from urllib.parse import unquote
+from bs4 import BeautifulSoup
+
+# Attributes of chapter HTML that point at files (srcset holds a comma separated list of "url width" pairs)
+LINK_ATTRIBUTES = ('href', 'src', 'srcset', 'data', 'poster')
+# A filename only counts as linked when it is a whole path segment of a target
+SEGMENT_STARTS = ('/', '=', '\n')
+SEGMENT_ENDS = ('?', '#', '\n')
+
+
+class multi_pattern_matcher:
+    """
+    Aho–Corasick automaton over a set of patterns, so every pattern is found in one
+    pass over the text however many patterns there are.
+    """
+
+    def __init__(self, patterns: Iterable[str]) -> None:
+        self.transitions = [{}]
+        self.failure = [0]
+        self.outputs = [[]]
+        for pattern in patterns:
+            if pattern:
+                self.add_pattern(pattern)
+        self.build_failure_links()
+
+    def add_pattern(self, pattern: str) -> None:
+        state = 0
+        for char in pattern:
+            next_state = self.transitions[state].get(char)
+            if next_state is None:
+                next_state = len(self.transitions)
+                self.transitions[state][char] = next_state
+                self.transitions.append({})
+                self.failure.append(0)
+                self.outputs.append([])
+            state = next_state
+        self.outputs[state].append(pattern)
+
+    def build_failure_links(self) -> None:
+        queue = deque(self.transitions[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self.transitions[state].items():
+                queue.append(next_state)
+                fallback = self.failure[state]
+                while fallback and char not in self.transitions[fallback]:
+                    fallback = self.failure[fallback]
+                self.failure[next_state] = self.transitions[fallback].get(char, 0)
+                self.outputs[next_state] = self.outputs[next_state] + self.outputs[self.failure[next_state]]
+
+    def iter_matches(self, text: str) -> Iterator[Tuple[int, str]]:
+        """(start index, pattern) of every occurrence of every pattern in text"""
+        state = 0
+        for index, char in enumerate(text):
+            while state and char not in self.transitions[state]:
+                state = self.failure[state]
+            state = self.transitions[state].get(char, 0)
+            for pattern in self.outputs[state]:
+                yield index - len(pattern) + 1, pattern
+
+
+def extract_link_targets(html_content: str) -> List[str]:
+    """URL-decoded href/src (and srcset, data, poster) targets of an HTML fragment"""
+    if not html_content:
+        return []
+    targets = []
+    soup = BeautifulSoup(html_content, 'html.parser')
+    for tag in soup.find_all(lambda tag: any(attribute in tag.attrs for attribute in LINK_ATTRIBUTES)):
+        for attribute in LINK_ATTRIBUTES:
+            value = tag.get(attribute)
+            if not value:
+                continue
+            if attribute == 'srcset':
+                targets.extend(unquote(candidate.split()[0]) for candidate in value.split(',') if candidate.strip())
+            else:
+                targets.append(unquote(value.strip()))
+    return targets
+
+
+def find_linked_filenames(html_content: str, filenames: Iterable[str]) -> Set[str]:
+    """
+    The filenames (as given, URL-encoded or not) linked from html_content.
+
+    All filenames are matched in a single scan over the decoded link targets, rather than
+    searching the whole HTML once per file.
+    """
+    decoded_filenames: Dict[str, List[str]] = {}
+    for filename in filenames:
+        if filename:
+            decoded_filenames.setdefault(unquote(filename), []).append(filename)
+    if not decoded_filenames:
+        return set()
+
+    targets = '\n'.join(extract_link_targets(html_content))
+    if not targets:
+        return set()
+
+    linked = set()
+    for start, pattern in multi_pattern_matcher(decoded_filenames).iter_matches(targets):
+        end = start + len(pattern)
+        if (start == 0 or targets[start - 1] in SEGMENT_STARTS) and (end == len(targets) or targets[end] in SEGMENT_ENDS):
+            linked.update(decoded_filenames[pattern])
+    return linked
@@ -5,8 +5,16 @@ import json
 import csv
 from bs4 import BeautifulSoup
 import re
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
 from urllib.parse import urlparse, parse_qs
 from lib.content_cleaners import content_cleaners
+from lib.harvest_manifest import harvest_manifest
+from lib.harvest_journal import harvest_journal
+from lib.stream_writer import csv_stream_writer, jsonl_stream_writer
+from lib.output_backends import get_output_backend
+from lib.content_store import content_store
+from lib.course_model import modules_to_dataframe
 from block.block_content import block_content
 from mod.book import mod_book
 from mod.page import mod_page
@@ -16,7 +24,7 @@ from mod.url import mod_url
 from mod.forum import mod_forum
 
 class moodle_content_helpers:
-    def __init__(self, moodle_rest) -> None:
+    def __init__(self, moodle_rest, incremental=None, output_format=None, resume=False) -> None:
         self.data_store_path = 'course_data/'
         self.moodle_rest = moodle_rest
         self.content_cleaner = content_cleaners()
@@ -27,6 +35,34 @@ class moodle_content_helpers:
         self.file_content = mod_resource(moodle_rest)
         self.url_content = mod_url(moodle_rest)
         self.forum_content = mod_forum(moodle_rest)
+        # Extractors mostly wait on Moodle, so each module type runs on a shared thread pool
+        self.extraction_pool = ThreadPoolExecutor(max_workers=int(os.getenv('MODULE_WORKERS', '7')), thread_name_prefix='extract')
+        self.stage_timings = {}
+        # Reuse unchanged rows from the previous run's CSVs (see lib/harvest_manifest.py)
+        if incremental is None:
+            incremental = os.getenv('MOODLE_INCREMENTAL', 'False').lower() in ['true', '1', 'yes']
+        self.incremental = incremental
+        self.manifest = None
+        # Stage outputs are only snapshotted when they can be resumed: a --resume run, or HARVEST_JOURNAL_STAGES
+        self.journal = harvest_journal(save_stages=True if resume else None)
+        self.pending_files = None  # (temporary, final, streamed) paths while save_course_data is writing a course
+        self.stream_writers = []  # Every stream writer opened for the current course, until it is saved or discarded
+        # Tables are saved as CSV, Parquet or JSON Lines (see lib/output_backends.py)
+        self.output_backend = get_output_backend(output_format or os.getenv('MOODLE_OUTPUT_FORMAT', 'csv'), self.data_store_path)
+        # Optional SQLite database of every course's tables, written alongside the files (see lib/content_store.py)
+        self.content_store = content_store.from_env()
+        # Write module rows to their CSV (or JSON Lines) as they are extracted instead of building DataFrames
+        self.stream_output = self.output_backend.stream_by_default or os.getenv('MOODLE_STREAM_OUTPUT', 'False').lower() in ['true', '1', 'yes']
+        if self.stream_output and not self.output_backend.supports_streaming:
+            print(f"MOODLE_STREAM_OUTPUT is not supported for {self.output_backend.name} output, tables are written once extracted")
+            self.stream_output = False
+
+    def close(self):
+        """Shut down the extraction and forum post thread pools and close the content store"""
+        self.extraction_pool.shutdown(wait=True, cancel_futures=True)
+        self.forum_content.close()
+        if self.content_store is not None:
+            self.content_store.close()
 
     def get_page_content(self, page_cmid):
         pass
@@ -41,45 +77,109 @@ class moodle_content_helpers:
         course_name = course['fullname']
         course_idnumber = course['idnumber']
         course_sections = self.moodle_rest.get_course_sections(course_id)
-        course_modules = self.moodle_rest.get_course_modules(course_id)
+        course_modules = self.moodle_rest.get_course_structure(course_id).get_modules()  # course_module records, no DataFrame
         course_blocks = self.moodle_rest.get_course_blocks(course_id)
         course_resources = self.moodle_rest.get_course_resources(course_id)
         return course, course_modules, course_sections, course_blocks, course_resources
 
     def save_course_data(self, course, course_sections, course_resources, course_blocks, course_books, course_files, course_folders, course_pages, course_labels, course_urls, course_forums):
         course_idnumber = course['idnumber']
-        self.save_item_raw(course, course_idnumber, f"{course_idnumber}_course")
-        self.save_item_raw(course_sections, course_idnumber, f"{course_idnumber}_sections")
-        self.save_item_raw(course_resources, course_idnumber, f"{course_idnumber}_modules")
-        self.save_item_raw(course_books, course_idnumber, f"{course_idnumber}_books")
-        self.save_item_raw(course_blocks, course_idnumber, f"{course_idnumber}_blocks")
-        self.save_item_raw(course_pages, course_idnumber, f"{course_idnumber}_pages")
-        self.save_item_raw(course_labels, course_idnumber, f"{course_idnumber}_labels")
-        self.save_item_raw(course_files, course_idnumber, f"{course_idnumber}_files")
-        self.save_item_raw(course_folders, course_idnumber, f"{course_idnumber}_folders")
-        self.save_item_raw(course_urls, course_idnumber, f"{course_idnumber}_urls")
-        self.save_item_raw(course_forums, course_idnumber, f"{course_idnumber}_forums")
+        tables = {
+            'course': course,
+            'sections': course_sections,
+            'modules': course_resources,
+            'books': course_books,
+            'blocks': course_blocks,
+            'pages': course_pages,
+            'labels': course_labels,
+            'files': course_files,
+            'folders': course_folders,
+            'urls': course_urls,
+            'forums': course_forums,
+        }
+        self.pending_files = []
+        try:
+            for table, item_to_save in tables.items():
+                self.save_item_raw(item_to_save, course_idnumber, f"{course_idnumber}_{table}")
+            if self.content_store is not None:
+                # One transaction per course, committed just before the course's files are renamed into place
+                self.content_store.save_course(course_idnumber, tables)
+        except Exception:
+            self.discard_pending_files()
+            raise
+        self.commit_pending_files()
+        # Written last so a run that dies mid-save never records rows that weren't saved
+        if self.manifest is not None and self.manifest.course_idnumber == course_idnumber:
+            self.manifest.save()
+            self.manifest = None
         return
 
     def save_item_raw(self, item_to_save, directory, filename):
-        if isinstance(item_to_save, pd.DataFrame) :
-            os.makedirs(os.path.dirname(f"{self.data_store_path}{directory}/{filename}.csv"), exist_ok=True)
-            item_to_save.to_csv(f"{self.data_store_path}{directory}/{filename}.csv", index=False)
-        elif isinstance(item_to_save, pd.Series):
-            os.makedirs(os.path.dirname(f"{self.data_store_path}{directory}/{filename}.csv"), exist_ok=True)
-            item_to_save.to_csv(f"{self.data_store_path}{directory}/{filename}.csv", header=False)
+        if isinstance(item_to_save, (pd.DataFrame, pd.Series)):
+            final_path = self.output_backend.get_path(directory, filename)
+            os.makedirs(os.path.dirname(final_path), exist_ok=True)
+            self.output_backend.write(item_to_save, self.get_write_path(final_path))
         elif isinstance(item_to_save, dict):
-            with open(f"{self.data_store_path}{directory}/{filename}.json", "w") as file:
+            with open(self.get_write_path(f"{self.data_store_path}{directory}/{filename}.json"), "w") as file:
                 json.dump(item_to_save, file)
         elif isinstance(item_to_save, list):
-            with open(f"{self.data_store_path}{directory}/{filename}.csv", "w") as file:
+            with open(self.get_write_path(f"{self.data_store_path}{directory}/{filename}.csv"), "w") as file:
                 writer = csv.writer(file)
                 writer.writerows(item_to_save)
+        elif isinstance(item_to_save, (csv_stream_writer, jsonl_stream_writer)):
+            # Already written while extracting, only the rename is left
+            item_to_save.close()
+            final_path = item_to_save.final_path
+            if self.pending_files is None:
+                os.replace(item_to_save.temp_path, final_path)
+            else:
+                self.pending_files.append((item_to_save.temp_path, final_path, True))
         return
+
+    def open_stream_writer(self, course, table, extractor):
+        """The output backend's stream writer for one of a course's tables, using the extractor's (ModuleHelper or mod_forum) column schema"""
+        course_idnumber = course['idnumber']
+        writer = self.output_backend.open_stream_writer(course_idnumber, f"{course_idnumber}_{table}", extractor.get_output_columns())
+        self.stream_writers.append(writer)
+        return writer
+
+    def get_write_path(self, final_path):
+        """Where to write final_path: a temporary name while a course is being saved, renamed by commit_pending_files"""
+        if self.pending_files is None:
+            return final_path
+        temp_path = f"{final_path}.{os.getpid()}.part"
+        self.pending_files.append((temp_path, final_path, False))
+        return temp_path
+
+    def commit_pending_files(self):
+        """Rename a course's files into place together, only once every one of them has been written"""
+        pending_files, self.pending_files = self.pending_files or [], None
+        for temp_path, final_path, _ in pending_files:
+            os.replace(temp_path, final_path)
+        self.stream_writers = []
+
+    def discard_pending_files(self):
+        pending_files, self.pending_files = self.pending_files or [], None
+        for temp_path, _, streamed in pending_files:
+            if not streamed and os.path.exists(temp_path):
+                os.remove(temp_path)
+        self.discard_stream_writers()
+
+    def discard_stream_writers(self):
+        """Close the current course's stream writers and remove their temporary files, including ones save_course_data never reached"""
+        stream_writers, self.stream_writers = self.stream_writers, []
+        if self.journal.save_stages:
+            return  # Kept for --resume, which reloads the writers of finished stages from the journal
+        for writer in stream_writers:
+            writer.close()
+            if os.path.exists(writer.temp_path):
+                os.remove(writer.temp_path)
     
     def append_course_modules(self, course_modules, directory):
         full_directory_path = os.path.join(self.data_store_path, directory)
         os.makedirs(full_directory_path, exist_ok=True)  # Ensure the directory exists
+        if not isinstance(course_modules, pd.DataFrame):
+            course_modules = modules_to_dataframe(course_modules)
         course_modules.to_csv(os.path.join(full_directory_path, "course_modules.csv"), mode='a', index=False)
         return
     
@@ -101,17 +201,75 @@ class moodle_content_helpers:
         return all_files
 
     
+    def run_stages(self, stages, course_id=None):
+        """
+        Run extraction stages concurrently on the pool, wait for all of them and report per-stage timings.
+        When the journal saves stages, finished stages are checkpointed in it, and ones already journalled for course_id are reloaded.
+        """
+        def timed_stage(stage_name, stage):
+            start = time.perf_counter()
+            try:
+                if course_id is not None and self.journal.is_stage_completed(course_id, stage_name):
+                    return self.journal.load_stage(course_id, stage_name)
+                output = stage()
+                if course_id is not None and self.journal.save_stages:
+                    self.journal.save_stage(course_id, stage_name, output)
+                return output
+            finally:
+                self.stage_timings[stage_name] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        self.stage_timings = {}
+        futures = {stage_name: self.extraction_pool.submit(timed_stage, stage_name, stage) for stage_name, stage in stages.items()}
+        try:
+            results = {stage_name: future.result() for stage_name, future in futures.items()}
+        except BaseException:
+            # Stop the other stages before the next course starts, they share the manifest and output files
+            for future in futures.values():
+                future.cancel()
+            wait(futures.values())
+            self.discard_stream_writers()
+            raise
+        timings = ", ".join(f"{stage_name} {elapsed:.1f}s" for stage_name, elapsed in sorted(self.stage_timings.items(), key=lambda item: -item[1]))
+        print(f"Extracted course content in {time.perf_counter() - start:.1f}s ({timings})")
+        return results
+
     def get_course_content(self, course, course_modules, course_sections, course_blocks, course_resources):
         # Temp debug code
         self.append_course_modules(course_modules, "debug")
 
-        course_block_content = self.block_content.get_block_content(course_blocks, course, course_resources)
-        course_book_content = self.book_content.get_book_content(course_modules, course)
-        course_page_content = self.page_content.get_page_content(course_modules, course)
-        course_label_content = self.label_content.get_label_content(course_modules, course)
-        course_file_content, course_folder_content = self.file_content.get_resource_content(course_modules, course)
-        course_url_content = self.url_content.get_url_content(course_modules, course)
-        course_forum_content = self.forum_content.get_forum_content(course_modules, course)
+        manifest = harvest_manifest(self.data_store_path, course['idnumber']) if self.incremental else None
+        self.manifest = manifest
+        self.discard_stream_writers()  # Any left by a course that failed before it was saved
+        if self.stream_output:
+            stages = {
+                'books': lambda: self.book_content.get_book_content(course_modules, course, manifest, self.open_stream_writer(course, 'books', self.book_content.mod_helper)),
+                'pages': lambda: self.page_content.get_page_content(course_modules, course, manifest, self.open_stream_writer(course, 'pages', self.page_content.helper)),
+                'resources': lambda: self.file_content.get_resource_content(course_modules, course, manifest, (
+                    self.open_stream_writer(course, 'files', self.file_content.resource_helper),
+                    self.open_stream_writer(course, 'folders', self.file_content.folder_helper))),
+                'labels': lambda: self.label_content.get_label_content(course_modules, course, manifest, self.open_stream_writer(course, 'labels', self.label_content.helper)),
+                'urls': lambda: self.url_content.get_url_content(course_modules, course, manifest, self.open_stream_writer(course, 'urls', self.url_content.helper)),
+                'forums': lambda: self.forum_content.get_forum_content(course_modules, course, manifest, self.open_stream_writer(course, 'forums', self.forum_content)),
+            }
+        else:
+            stages = {
+                'books': lambda: self.book_content.get_book_content(course_modules, course, manifest),
+                'pages': lambda: self.page_content.get_page_content(course_modules, course, manifest),
+                'resources': lambda: self.file_content.get_resource_content(course_modules, course, manifest),
+                'labels': lambda: self.label_content.get_label_content(course_modules, course, manifest),
+                'urls': lambda: self.url_content.get_url_content(course_modules, course, manifest),
+                'forums': lambda: self.forum_content.get_forum_content(course_modules, course, manifest),
+            }
+        stages['blocks'] = lambda: self.block_content.get_block_content(course_blocks, course, course_resources)
+        results = self.run_stages(stages, int(course['id']))
+        course_block_content = results['blocks']
+        course_book_content = results['books']
+        course_page_content = results['pages']
+        course_label_content = results['labels']
+        course_file_content, course_folder_content = results['resources']
+        course_url_content = results['urls']
+        course_forum_content = results['forums']
         return course_block_content, course_book_content, course_page_content, course_label_content, course_sections, course_file_content, course_folder_content, course_resources, course_url_content, course_forum_content
 
         # Lots more todo here
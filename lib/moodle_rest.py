@@ -1,9 +1,21 @@
 import pandas as pd
 import httpx
+import importlib.util
 import json
 import os
+import gzip
+import hashlib
+import threading
+from contextlib import contextmanager
 from dotenv import load_dotenv
 from lib.event_logger import EventLogger
+from lib.request_coalescer import request_coalescer
+from lib.adaptive_limiter import adaptive_limiter, retry_budget
+from lib.course_catalog import course_catalog
+from lib.json_stream import load_json_stream
+from lib.course_structure import normalize_course_blocks
+from lib.course_model import course_model
+from lib.auth_store import auth_store
 from typing import Optional, Dict, Any
 from tenacity import retry, stop_after_attempt, wait_exponential
 import time
@@ -14,12 +26,34 @@ class MoodleRESTError(Exception):
     """Custom exception for Moodle REST API errors"""
     pass
 
-class DatabaseConnectionError(MoodleRESTError):
+class TransientMoodleError(MoodleRESTError):
+    """Raised for failures worth retrying: database connection errors, 5xx responses and timeouts"""
+    pass
+
+class DatabaseConnectionError(TransientMoodleError):
     """Raised when database connection issues occur"""
     pass
 
+def should_retry_request(retry_state) -> bool:
+    """Tenacity retry test: only transient errors are retried, and only while the shared retry budget allows"""
+    if not isinstance(retry_state.outcome.exception(), TransientMoodleError):
+        return False
+    return retry_state.args[0].retry_budget.withdraw()
+
+# Moodle *_by_courses web-service functions prefetched for many course ids at once, and the response key holding their items.
+# Only resources are read by set_course, book/page/label/url/forum content comes from core_course_get_contents.
+BY_COURSES_FUNCTIONS = {
+    'mod_resource_get_resources_by_courses': 'resources',
+}
+
+# Responses decoded as they download when MOODLE_STREAM_CONTENTS is set
+STREAMED_FUNCTIONS = ('core_course_get_contents',)
+
+# Course fields that core_course_get_courses_by_field can look up directly
+TARGETED_COURSE_FIELDS = ('id', 'idnumber', 'shortname')
+
 class moodle_rest:
-    def __init__(self, use_uat=False):
+    def __init__(self, use_uat=False, response_cache=None):
         load_dotenv(override=True)
         self.use_uat = use_uat
         if self.use_uat:
@@ -39,32 +73,87 @@ class moodle_rest:
         self.headers = {"Accept": "application/json"}
         self.timeout = 60
         self.max_retries = 3
-        self.retry_delay = 5  # seconds
+        self.concurrency_limiter = adaptive_limiter.from_env()  # Backs off when Moodle's database struggles
+        self.retry_budget = retry_budget.from_env()  # Shared by every request, stops retry storms
         self.moodle_web_session = None
+        self.auth_store = None
+        if os.getenv('MOODLE_AUTH_CACHE', 'True').lower() in ['true', '1', 'yes']:
+            self.auth_store = auth_store()  # Reuse the mobile token / web session from previous runs
+        self.response_cache = response_cache  # Optional lib.response_cache.response_cache
+        self.request_coalescer = None
+        if os.getenv('MOODLE_COALESCE', 'True').lower() in ['true', '1', 'yes']:
+            self.request_coalescer = request_coalescer(max_memo_bytes=int(float(os.getenv('MOODLE_COALESCE_MEMO_MB', '0')) * 1024 * 1024))
+        self.course_catalog_path = os.getenv('COURSE_CATALOG_PATH', 'course_data/.cache/course_catalog.json.gz')
+        self.course_catalog_ttl = int(os.getenv('COURSE_CATALOG_TTL', '86400'))
+        self.download_path = os.getenv('MOODLE_DOWNLOAD_PATH', 'course_data/.cache/downloads/')
+        self.max_file_bytes = int(os.getenv('MOODLE_MAX_FILE_MB', '100')) * 1024 * 1024
+        self.stream_contents = os.getenv('MOODLE_STREAM_CONTENTS', 'False').lower() in ['true', '1', 'yes']
+        self.prefetch_chunk_size = int(os.getenv('PREFETCH_CHUNK_SIZE', '50'))
+        self.prefetched_by_courses = {moodle_function: {} for moodle_function in BY_COURSES_FUNCTIONS}
+        self.forum_page_size = int(os.getenv('MOODLE_FORUM_PAGE_SIZE', '100'))
+
+        # One long-lived pooled client for every web-service call (keep-alive, optional HTTP/2)
+        self.http_client = self.create_http_client()
 
         # Initialize connection
         self.initialize_connection()
 
-  
+    def create_http_client(self) -> httpx.Client:
+        """Build the shared httpx client using pool settings from .env"""
+        max_connections = int(os.getenv('MOODLE_MAX_CONNECTIONS', '20'))
+        max_keepalive = int(os.getenv('MOODLE_MAX_KEEPALIVE', '10'))
+        keepalive_expiry = float(os.getenv('MOODLE_KEEPALIVE_EXPIRY', '30'))
+        use_http2 = os.getenv('MOODLE_HTTP2', 'False').lower() in ['true', '1', 'yes']
+        if use_http2 and importlib.util.find_spec('h2') is None:
+            self.event_logger.log_data("http2_unavailable", "MOODLE_HTTP2 set but the h2 package is not installed (pip install httpx[http2]), using HTTP/1.1")
+            use_http2 = False
+        limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive,
+            keepalive_expiry=keepalive_expiry
+        )
+        return httpx.Client(http2=use_http2, limits=limits, timeout=self.timeout)
+
+    def close(self):
+        """Close pooled connections and any web session"""
+        if self.http_client is not None:
+            self.http_client.close()
+            self.http_client = None
+        if self.moodle_web_session is not None:
+            self.moodle_web_session.close()
+        if self.response_cache is not None:
+            self.response_cache.close()
+        self.event_logger.flush_events()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
     def initialize_connection(self):
         """Initialize connection and required data with retry logic"""
         try:
-            self.moodle_mobile_token = self.get_moodle_mobile_token()
-            self.moodle_courses = None
+            if self.response_cache is not None and self.response_cache.offline:
+                self.moodle_mobile_token = None  # Offline runs only use cached web-service responses
+            else:
+                self.moodle_mobile_token = self.get_moodle_mobile_token()
+            self.course_catalog = None  # Full indexed catalog, only loaded when a search needs it
+            self.targeted_courses = course_catalog()  # Courses found by targeted lookups
             self.current_course = None
             self.current_course_blocks = None
-            self.current_course_modules = None
-            self.current_course_sections = None
-            self.current_course_content = None
+            self.current_course_structure = None  # course_model of sections and modules
             self.current_course_resources = None
-            self.get_courses()
         except Exception as e:
             self.event_logger.log_data("initialization_error", f"Failed to initialize Moodle connection: {str(e)}")
             raise
 
     # Returns a tuple of web token and api token but only one will be set, with the priority being mobile app token
     def get_moodle_mobile_token(self):
-        response = httpx.get(
+        if self.restore_saved_auth():
+            return self.moodle_mobile_token
+        response = self.http_client.get(
             # f"{self.moodle_url}/login/token.php?username={self.moodle_user}&password={self.moodle_password}&service=rvc_external_webservices",
             f"{self.moodle_url}/login/token.php?username={self.moodle_user}&password={self.moodle_password}&service=moodle_mobile_app",
             timeout=60
@@ -75,7 +164,10 @@ class moodle_rest:
                 print(f"Now attempting to get a web login, which requires MOODLE_USER and MOODLE_PASSWORD to be set in .env")
                 self.get_moodle_session()
                 return None
-            return response.json().get('token')
+            mobile_token = response.json().get('token')
+            if self.auth_store is not None:
+                self.auth_store.save(self.moodle_url, self.moodle_user, mobile_token=mobile_token)
+            return mobile_token
         else:
             raise Exception(f"Failed to get token: {response.text}")
     
@@ -104,64 +196,277 @@ class moodle_rest:
             raise Exception(f"Failed to login: {login_response.text[:200]}")
         else:
             print("Successfully logged in so now using web requests rather than mobile requests")
+        if self.auth_store is not None:
+            self.auth_store.save(self.moodle_url, self.moodle_user, cookies=session.cookies.get_dict())
         return
 
+    def restore_saved_auth(self) -> bool:
+        """Reuse a saved mobile token or web session if Moodle still accepts it, sets moodle_mobile_token"""
+        if self.auth_store is None:
+            return False
+        saved_auth = self.auth_store.load(self.moodle_url, self.moodle_user)
+        if not saved_auth:
+            return False
+        if saved_auth.get('mobile_token') and self.is_mobile_token_valid(saved_auth['mobile_token']):
+            self.moodle_mobile_token = saved_auth['mobile_token']
+            return True
+        if saved_auth.get('cookies') and self.restore_moodle_session(saved_auth['cookies']):
+            self.moodle_mobile_token = None
+            return True
+        self.auth_store.forget(self.moodle_url, self.moodle_user)
+        return False
+
+    def is_mobile_token_valid(self, mobile_token) -> bool:
+        """Cheap check of a saved token with core_webservice_get_site_info"""
+        try:
+            response = self.http_client.get(
+                self.moodle_url + self.rest_endpoint,
+                params={"wstoken": mobile_token, "moodlewsrestformat": "json", "wsfunction": "core_webservice_get_site_info"},
+                headers=self.headers,
+                timeout=30
+            )
+            return response.status_code == 200 and 'exception' not in response.json()
+        except (httpx.RequestError, ValueError):
+            return False
+
+    def restore_moodle_session(self, cookies) -> bool:
+        """Reuse saved session cookies if Moodle does not send us back to the login page"""
+        session = requests.Session()
+        session.cookies.update(cookies)
+        try:
+            response = session.get(f"{self.moodle_url}/my/", allow_redirects=False, timeout=30)
+        except requests.RequestException:
+            return False
+        if response.status_code != 200:
+            session.close()
+            return False
+        self.moodle_web_session = session
+        return True
+
         
     def get_courses(self):
-        if self.moodle_courses is None:
-            response = self.get_moodle_rest_request('core_course_get_courses')
-            self.moodle_courses = pd.DataFrame(response)
-        return self.moodle_courses
+        """Full course catalog as a DataFrame"""
+        return self.get_course_catalog().to_dataframe()
+
+    def get_course_catalog(self):
+        """Full indexed course catalog, loaded on first use from a fresh local snapshot or core_course_get_courses"""
+        if self.course_catalog is None:
+            courses = self.load_course_catalog_snapshot()
+            if courses is None:
+                courses = self.get_moodle_rest_request('core_course_get_courses')
+                if isinstance(courses, list):
+                    self.save_course_catalog_snapshot(courses)
+                else:
+                    courses = []
+            self.course_catalog = course_catalog(courses)
+        return self.course_catalog
 
-    # Get the html content of a Moodle file (index.html) object
-    def get_moodle_web_file_content(self, moodle_file_url):
+    def load_course_catalog_snapshot(self):
+        """Courses from the local snapshot if it is for this site and younger than COURSE_CATALOG_TTL"""
+        if not os.path.exists(self.course_catalog_path):
+            return None
         try:
+            with gzip.open(self.course_catalog_path, 'rt', encoding='utf-8') as file:
+                snapshot = json.load(file)
+        except (OSError, ValueError) as e:
+            self.event_logger.log_data("course_catalog_snapshot_error", f"Ignoring unreadable snapshot {self.course_catalog_path}: {str(e)}")
+            return None
+        if snapshot.get('moodle_url') != self.moodle_url or time.time() - snapshot.get('created', 0) > self.course_catalog_ttl:
+            return None
+        return snapshot.get('courses')
 
-            if self.moodle_mobile_token is None:
-                moodle_file_url = moodle_file_url.replace('/webservice', '')  # Remove /webservice from URL
-                if self.moodle_web_session is None:
-                    raise Exception("No session available for web requests")
-                response = self.moodle_web_session.get(
-                    moodle_file_url,
-                    timeout=60  # 1 minutes in seconds
-                )
-                if "login" in response.url:
-                    raise Exception("Login required to access file - alter this code to deal with that failure!")
+    def save_course_catalog_snapshot(self, courses):
+        """Write the catalog as gzipped JSON, every field kept so courses read back are the records Moodle returned"""
+        os.makedirs(os.path.dirname(self.course_catalog_path) or '.', exist_ok=True)
+        temp_path = f"{self.course_catalog_path}.tmp"
+        with gzip.open(temp_path, 'wt', encoding='utf-8') as file:
+            json.dump({'moodle_url': self.moodle_url, 'created': time.time(), 'courses': courses}, file)
+        os.replace(temp_path, self.course_catalog_path)
 
-            else:
-                token_param = f'token={self.moodle_mobile_token}'
+    def get_courses_by_field(self, field, values):
+        """
+        Targeted lookup without downloading the whole catalog. core_course_get_courses_by_field only finds the ids,
+        the records come from core_course_get_courses like the full catalog's, so a course has the same fields either way
+        """
+        if field == 'id':
+            course_ids = [int(value) for value in values]
+        else:
+            course_ids = []
+            for value in values:
+                response = self.get_moodle_rest_request('core_course_get_courses_by_field', field=field, value=value)
+                course_ids.extend(course['id'] for course in response.get('courses', []))
+        found_courses = []
+        for start in range(0, len(course_ids), 100):
+            response = self.get_moodle_rest_request('core_course_get_courses', options={'ids': course_ids[start:start + 100]})
+            if isinstance(response, list):
+                found_courses.extend(response)
+        self.targeted_courses.add_courses(found_courses)
+        return pd.DataFrame(found_courses)
+
+    def get_known_courses(self, field, values):
+        """Catalog to search for these values: the full catalog if loaded, otherwise targeted lookups of the values"""
+        if self.course_catalog is not None or field not in TARGETED_COURSE_FIELDS:
+            return self.get_course_catalog()
+        missing_values = [value for value in values if not self.targeted_courses.contains(field, value)]
+        if missing_values:
+            self.get_courses_by_field(field, missing_values)
+        return self.targeted_courses
+
+    # Get the html content of a Moodle file (index.html) object
+    def get_moodle_web_file_content(self, moodle_file_url):
+        try:
+            # Named per thread and process, so concurrent fetches of the same URL never share a file
+            download_name = f"{hashlib.sha256(moodle_file_url.encode('utf-8')).hexdigest()}.{os.getpid()}.{threading.get_ident()}"
+            download_path = os.path.join(self.download_path, download_name)
+            download = self.stream_moodle_web_file(moodle_file_url, download_path, max_bytes=self.max_file_bytes, content_type_prefix='text/')
+            if download is None:
+                return None
+            with open(download['path'], 'rb') as file:
+                content = file.read().decode(download['encoding'], errors='replace')
+            os.remove(download['path'])
+            return content
 
-                separator = '&' if '?' in moodle_file_url else '?'
-                response = httpx.get(
-                    f'{moodle_file_url}{separator}{token_param}',
-                    timeout=300  # 5 minutes in seconds
-                )
-            
-            response.raise_for_status()
-            # we should have a reponse by now
-            try:
-                # Try to parse as JSON
-                json_content = response.json()
-                # If it's JSON and has error, log the error
-                if 'error' in json_content:
-                    self.event_logger.log_data("get moodle web file content error", f"Error in response: {json_content['error']}")
-                # If it's JSON but no error (shouldn't happen), fall through to return text
-            except ValueError:
-                # Not JSON, so must be HTML - this is the expected case
-                pass
-            
-            # Return the raw text content in all success cases
-            return response.text
-            
         except Exception as e:
             self.event_logger.log_data("Unknown error getting html moodle content", f"Error getting moodle file content for {moodle_file_url}: {str(e)}")
             return None
 
+    def download_moodle_web_file(self, moodle_file_url, destination_path=None, max_bytes=None, content_type_prefix=None):
+        """
+        Stream a Moodle file (book media, resources) to disk without holding it in memory, for callers that only need
+        the file. destination_path defaults to a name under MOODLE_DOWNLOAD_PATH unique to this process and thread, and
+        max_bytes to MOODLE_MAX_FILE_MB. Returns the path (the caller owns the file), or None on failure.
+        """
+        try:
+            if destination_path is None:
+                download_name = f"{hashlib.sha256(moodle_file_url.encode('utf-8')).hexdigest()}.{os.getpid()}.{threading.get_ident()}"
+                destination_path = os.path.join(self.download_path, download_name)
+            download = self.stream_moodle_web_file(moodle_file_url, destination_path, max_bytes=max_bytes or self.max_file_bytes, content_type_prefix=content_type_prefix)
+            return download['path'] if download else None
+        except Exception as e:
+            self.event_logger.log_data("Unknown error downloading moodle file", f"Error downloading {moodle_file_url}: {str(e)}")
+            return None
 
-    def get_forum_discussions(self, forum_id):
-        response = self.get_moodle_rest_request('mod_forum_get_forum_discussions', forumid=forum_id)
+    @contextmanager
+    def open_moodle_web_file(self, moodle_file_url, headers):
+        """Open a streamed response for a Moodle file with the mobile token or web session, yields (status, headers, byte chunks)"""
+        if self.moodle_mobile_token is None:
+            moodle_file_url = moodle_file_url.replace('/webservice', '')  # Remove /webservice from URL
+            if self.moodle_web_session is None:
+                raise Exception("No session available for web requests")
+            response = self.moodle_web_session.get(moodle_file_url, headers=headers, stream=True, timeout=60)
+            if "login" in response.url:
+                # Session expired mid-run, log in again once and retry
+                response.close()
+                self.get_moodle_session()
+                response = self.moodle_web_session.get(moodle_file_url, headers=headers, stream=True, timeout=60)
+            try:
+                if "login" in response.url:
+                    raise Exception("Login required to access file - alter this code to deal with that failure!")
+                yield response.status_code, response.headers, response.iter_content(chunk_size=65536)
+            finally:
+                response.close()
+        else:
+            token_param = f'token={self.moodle_mobile_token}'
+            separator = '&' if '?' in moodle_file_url else '?'
+            self.concurrency_limiter.acquire()
+            overloaded = False
+            try:
+                with self.http_client.stream('GET', f'{moodle_file_url}{separator}{token_param}', headers=headers,
+                                             timeout=300) as response:  # 5 minutes in seconds
+                    overloaded = response.status_code >= 500
+                    yield response.status_code, response.headers, response.iter_bytes(chunk_size=65536)
+            except httpx.TimeoutException:
+                overloaded = True
+                raise
+            finally:
+                self.concurrency_limiter.release(overloaded)
+
+    def stream_moodle_web_file(self, moodle_file_url, destination_path, max_bytes=None, content_type_prefix=None):
+        """
+        Download a Moodle file to destination_path through a .part file, checking the Content-Type
+        header before reading the body and resuming with Range after timeouts. A resume is sent
+        with If-Range (the ETag or Last-Modified of the first response), so a file that changed on
+        the server in the meantime is downloaded again whole rather than spliced.
+        destination_path must be unique to the caller. Returns {'path', 'content_type', 'encoding'} or None.
+        """
+        os.makedirs(os.path.dirname(destination_path) or '.', exist_ok=True)
+        part_path = f"{destination_path}.part"
+        if os.path.exists(part_path):
+            os.remove(part_path)  # Left by a run that died, its validator is gone
+        validator = None
+        try:
+            for attempt in range(1, self.max_retries + 1):
+                resume_from = os.path.getsize(part_path) if validator and os.path.exists(part_path) else 0
+                headers = {'Range': f'bytes={resume_from}-', 'If-Range': validator} if resume_from else {}
+                try:
+                    with self.open_moodle_web_file(moodle_file_url, headers) as (status_code, response_headers, chunks):
+                        if status_code == 416:  # Partial file is stale, start again
+                            os.remove(part_path)
+                            continue
+                        if status_code not in (200, 206):
+                            raise MoodleRESTError(f"HTTP Error: {status_code} for {moodle_file_url}")
+
+                        content_type = response_headers.get('content-type', '')
+                        if 'application/json' in content_type:
+                            # Moodle reports pluginfile errors (bad token, missing file) as a small JSON body
+                            error_body = b''.join(chunks)[:100000]
+                            self.event_logger.log_data("get moodle web file content error", f"Error in response for {moodle_file_url}: {error_body.decode('utf-8', errors='replace')}")
+                            return None
+                        if content_type_prefix and not content_type.startswith(content_type_prefix):
+                            self.event_logger.log_data("get moodle web file content type", f"Skipping {moodle_file_url}, expected {content_type_prefix} but got {content_type}")
+                            return None
+
+                        # 200 means a fresh copy (nothing to resume, or the file changed), so the .part is truncated
+                        resumed = status_code == 206 and resume_from > 0
+                        if not resumed:
+                            validator = response_headers.get('etag') or response_headers.get('last-modified')
+                        written = resume_from if resumed else 0
+                        content_length = response_headers.get('content-length')
+                        if max_bytes and content_length and written + int(content_length) > max_bytes:
+                            self.event_logger.log_data("moodle web file too large", f"{moodle_file_url} is {written + int(content_length)} bytes, limit {max_bytes}")
+                            return None
+                        with open(part_path, 'ab' if resumed else 'wb') as file:
+                            for chunk in chunks:
+                                written += len(chunk)
+                                if max_bytes and written > max_bytes:
+                                    self.event_logger.log_data("moodle web file too large", f"{moodle_file_url} passed the {max_bytes} byte limit")
+                                    return None
+                                file.write(chunk)
+
+                    os.replace(part_path, destination_path)
+                    charset = content_type.split('charset=')[-1].split(';')[0].strip() if 'charset=' in content_type else 'utf-8'
+                    return {'path': destination_path, 'content_type': content_type, 'encoding': charset}
+
+                except (httpx.TimeoutException, httpx.TransportError, requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                    # Keep the .part file, the next attempt resumes from where this one stopped
+                    self.event_logger.log_data("moodle web file download interrupted", f"Attempt {attempt} for {moodle_file_url}: {str(e)}")
+                    if attempt >= self.max_retries:
+                        raise
+            return None
+        finally:
+            if os.path.exists(part_path):
+                os.remove(part_path)
+
+    def get_forum_discussions(self, forum_id, page=None, perpage=None):
+        if page is None:
+            response = self.get_moodle_rest_request('mod_forum_get_forum_discussions', forumid=forum_id)
+        else:
+            response = self.get_moodle_rest_request('mod_forum_get_forum_discussions', forumid=forum_id, page=page, perpage=perpage)
         return response
 
+    def iter_forum_discussion_pages(self, forum_id, perpage=None):
+        """Yield a forum's discussions a page (perpage discussions) at a time"""
+        perpage = perpage or self.forum_page_size
+        page = 0
+        while True:
+            response = self.get_forum_discussions(forum_id, page=page, perpage=perpage)
+            discussions = response.get('discussions', []) if isinstance(response, dict) else []
+            if discussions:
+                yield discussions
+            if len(discussions) < perpage:
+                return
+            page += 1
+
     def get_forum_discussion_posts(self, discussion_id):
         response = self.get_moodle_rest_request('mod_forum_get_discussion_posts', discussionid=discussion_id)
         return response
@@ -170,18 +475,48 @@ class moodle_rest:
         response = self.get_moodle_rest_request('mod_book_get_books_by_courses', courseids=[course_id])
         return response
 
+    def prefetch_courses(self, course_ids, chunk_size=None):
+        """
+        Fetch resources for many courses with one *_by_courses call per chunk of courses,
+        so set_course is served from memory (each course's entry is dropped once used)
+        """
+        chunk_size = chunk_size or self.prefetch_chunk_size
+        course_ids = [int(course_id) for course_id in course_ids]
+        for start in range(0, len(course_ids), chunk_size):
+            chunk = course_ids[start:start + chunk_size]
+            for moodle_function, items_key in BY_COURSES_FUNCTIONS.items():
+                try:
+                    response = self.get_moodle_rest_request(moodle_function, courseids=chunk)
+                except Exception as e:
+                    self.event_logger.log_data("prefetch_error", f"{moodle_function} failed for courses {chunk}: {str(e)}")
+                    continue
+                items = response if items_key is None else response.get(items_key)
+                if not isinstance(items, list):
+                    continue  # Error response, leave these courses to per-course calls
+                items_by_course = {course_id: [] for course_id in chunk}
+                for item in items:
+                    items_by_course.setdefault(item.get('course'), []).append(item)
+                self.prefetched_by_courses[moodle_function].update(items_by_course)
+            print(f"Prefetched resources for {min(start + chunk_size, len(course_ids))} of {len(course_ids)} courses")
+
+    def get_by_courses(self, moodle_function, course_id):
+        """Per-course result of a *_by_courses function, from the prefetch if available (taken out of it, it is only needed once)"""
+        items_key = BY_COURSES_FUNCTIONS[moodle_function]
+        course_id = int(course_id)
+        items = self.prefetched_by_courses[moodle_function].pop(course_id, None)
+        if items is not None:
+            return items if items_key is None else {items_key: items, 'warnings': []}
+        return self.get_moodle_rest_request(moodle_function, courseids=[course_id])
+
     def get_course(self, course_id):
-        try:
-            course = self.moodle_courses.loc[self.moodle_courses['id'] == course_id]
-            return course.iloc[0]
-        except:
-            return None
+        return self.get_course_by('id', course_id)
         
     # general "search course fields for value" and if field valid name and match found return course
     def get_course_by(self, field='id', value=None):
         try:
-            course = self.moodle_courses.loc[self.moodle_courses[field] == value]
-            return course.iloc[0]
+            catalog = self.get_known_courses(field, [value])
+            courses = catalog.lookup(field, value)
+            return catalog.get_series(courses[0]) if courses else None
         except:
             return None
 
@@ -192,26 +527,16 @@ class moodle_rest:
             
             # Get course blocks with retry
             blocks_response = self.get_moodle_rest_request('core_block_get_course_blocks', courseid=course_id)
-            self.current_course_blocks = pd.DataFrame(blocks_response['blocks'])
-            
-            # Get course content with retry
-            content_response = self.get_moodle_rest_request('core_course_get_contents', courseid=course_id)
-            self.current_course_content = pd.DataFrame(content_response)
             
             # Get resources with retry
-            resources_response = self.get_moodle_rest_request('mod_resource_get_resources_by_courses', courseids=[course_id])
+            resources_response = self.get_by_courses('mod_resource_get_resources_by_courses', course_id)
             self.current_course_resources = pd.DataFrame(resources_response['resources'])
-            
-            # Process course modules
-            course_modules = pd.DataFrame()
-            for _, course_section in self.current_course_content.iterrows():
-                modules_to_add = pd.DataFrame(course_section['modules'])
-                modules_to_add['section_id'] = course_section['id']
-                course_modules = pd.concat([course_modules, modules_to_add], ignore_index=True)
-            
-            self.current_course_sections = self.current_course_content.drop(columns=['modules'])
-            self.current_course_modules = course_modules
-            self.current_course_blocks = self.get_block_content(course_id)
+
+            # Get course content with retry
+            content_response = self.get_moodle_rest_request('core_course_get_contents', courseid=course_id)
+            self.current_course_structure = course_model.from_contents(content_response)
+            # Titles and text from the block configs, the blocks response is reused rather than fetched again
+            self.current_course_blocks = normalize_course_blocks(blocks_response['blocks'])
             
             return self.get_course(course_id)
             
@@ -221,43 +546,40 @@ class moodle_rest:
 
     def get_matching_courses(self, field='id', value=None):
         if "*" in value:
-            pattern = value.replace("*", ".*")
+            # Wildcard searches need the full catalog
             try:
-                courses = self.moodle_courses[self.moodle_courses[field].str.match(pattern, na=False)]
-                return courses
+                catalog = self.get_course_catalog()
+                return catalog.to_dataframe(catalog.match(field, value))
             except:
                 return None
         else:
             try:
-                courses = self.moodle_courses.loc[self.moodle_courses[field] == value]
-                return courses
+                catalog = self.get_known_courses(field, [value])
+                return catalog.to_dataframe(catalog.lookup(field, value))
             except:
                 return None
 
     def get_matching_courses_from_list(self, field='id', list_of_values=None):
-        courses = pd.DataFrame()  # Initialize an empty DataFrame to store matching courses
-        for value in list_of_values:
-            try:
-                matched_courses = self.moodle_courses.loc[self.moodle_courses[field] == value]
-                courses = pd.concat([courses, matched_courses], ignore_index=True)
-            except Exception as e:
-                self.event_logger.log_data("get_matching_courses_from_list_error", f"Error matching course for value {value}: {str(e)}")
+        try:
+            catalog = self.get_known_courses(field, list_of_values)
+            courses = catalog.to_dataframe(catalog.lookup_many(field, list_of_values))
+        except Exception as e:
+            self.event_logger.log_data("get_matching_courses_from_list_error", f"Error matching courses for values {list_of_values}: {str(e)}")
+            return None
         return courses if not courses.empty else None
 
     # Note calling this with new course_id will update the current course
-    def get_course_modules(self, course_id):
-        if course_id == self.current_course:
-            return self.current_course_modules
-        else:
+    def get_course_structure(self, course_id):
+        """The course's sections and modules as a course_model"""
+        if course_id != self.current_course:
             self.set_course(course_id)
-            return self.current_course_modules
+        return self.current_course_structure
+
+    def get_course_modules(self, course_id):
+        return self.get_course_structure(course_id).get_modules_frame()
         
     def get_course_sections(self, course_id):
-        if course_id == self.current_course:
-            return self.current_course_sections
-        else:
-            self.set_course(course_id)
-            return self.current_course_sections
+        return self.get_course_structure(course_id).get_sections_frame()
         
     # Note calling this with new course_id will update the current course
     def get_course_blocks(self, course_id):
@@ -285,13 +607,7 @@ class moodle_rest:
 
 
     def get_block_content(self, course_id):
-        blocks = pd.DataFrame(self.get_moodle_rest_request('core_block_get_course_blocks', courseid=course_id)['blocks'])
-        blocks['block_title'] = None
-        blocks['block_text'] = None
-        # Apply the function only to rows where 'type' is 'html'
-        blocks['block_title'] = blocks.apply(lambda row: self.extract_block_configs(row, 'title'), axis=1)
-        blocks['block_text'] = blocks.apply(lambda row: self.extract_block_configs(row, 'text'), axis=1)
-        return blocks
+        return normalize_course_blocks(self.get_moodle_rest_request('core_block_get_course_blocks', courseid=course_id)['blocks'])
     
     def flatten_api_parameters(self, in_args, prefix=''):
         if isinstance(in_args, dict):
@@ -334,56 +650,103 @@ class moodle_rest:
         return False
 
 
-    # Call Moodle API - note does not throw exception on error
-    @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10))
+    # Call Moodle API, identical calls in a run share one request - note does not throw exception on error
     def get_moodle_rest_request(self, moodle_function: str, **kwargs) -> Dict[str, Any]:
         """
-        Enhanced Moodle REST API request with retry logic and better error handling
+        Moodle REST API request, coalesced with identical calls and served from the response cache when one is configured
         """
         parameters = dict(self.flatten_api_parameters(kwargs))
+        if self.request_coalescer is None:
+            return self.get_cached_moodle_rest_request(moodle_function, parameters)
+        return self.request_coalescer.call(
+            moodle_function, parameters,
+            lambda: self.get_cached_moodle_rest_request(moodle_function, parameters)
+        )
+
+    def get_cached_moodle_rest_request(self, moodle_function: str, parameters: Dict[str, Any]) -> Dict[str, Any]:
+        if self.response_cache is None:
+            return self.fetch_moodle_rest_request(moodle_function, parameters)
+
+        hit, response_data = self.response_cache.get(self.moodle_url, moodle_function, parameters)
+        if hit:
+            return response_data
+        if self.response_cache.offline:
+            raise MoodleRESTError(f"Offline and no cached response for {moodle_function} {parameters}")
+
+        response_data = self.fetch_moodle_rest_request(moodle_function, parameters)
+        if response_data:  # Swallowed errors come back as {} and are not worth keeping
+            self.response_cache.set(self.moodle_url, moodle_function, parameters, response_data)
+        return response_data
+
+    @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10), retry=should_retry_request, reraise=True)
+    def fetch_moodle_rest_request(self, moodle_function: str, parameters: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Moodle REST API request with retry of transient errors, within the retry budget and concurrency limit
+        """
+        parameters = dict(parameters)
         parameters.update({
             "wstoken": self.moodle_api_token,
             "moodlewsrestformat": "json",
             "wsfunction": moodle_function
         })
 
+        overloaded = False
+        self.concurrency_limiter.acquire()
         try:
-            response = httpx.get(
+            with self.http_client.stream(
+                'GET',
                 self.moodle_url + self.rest_endpoint,
                 params=parameters,
                 headers=self.headers,
                 timeout=120
-            )
-            
-            # Log non-200 responses
-            if response.status_code != 200:
-                self.event_logger.log_data(
-                    "api_error",
-                    f"Non-200 response: {response.status_code} - {response.text}"
-                )
-                response.raise_for_status()
-
-            response_data = response.json()
+            ) as response:
+
+                # Log non-200 responses, server side failures are worth a retry, client errors are not
+                if response.status_code != 200:
+                    response.read()
+                    self.event_logger.log_data(
+                        "api_error",
+                        f"Non-200 response: {response.status_code} - {response.text}"
+                    )
+                    if response.status_code >= 500 or response.status_code == 429:
+                        overloaded = True
+                        raise TransientMoodleError(f"HTTP Error: {response.status_code} for {moodle_function}")
+                    raise MoodleRESTError(f"HTTP Error: {response.status_code} for {moodle_function}")
+
+                if self.stream_contents and moodle_function in STREAMED_FUNCTIONS:
+                    # Decode section by section as the body arrives, so the body text is never held alongside the decoded course
+                    response_data = load_json_stream(response.iter_text())
+                else:
+                    response.read()
+                    response_data = response.json()
             
             # Check for database errors
             had_error = self.check_database_error(response_data)
+            self.retry_budget.deposit()
             if had_error:
                 return {} # Nothing to return
             
             return response_data
 
         except DatabaseConnectionError:
-            # Log database errors and retry
+            # Log database errors, the limiter backs off and the retry decorator handles it
+            overloaded = True
             self.event_logger.log_data("database_error", "Database connection issue detected")
-            # Sleep before retry
-            time.sleep(self.retry_delay)
-            raise  # Let retry decorator handle it
-            
+            raise
+
+        except MoodleRESTError:
+            raise
+
+        except httpx.TimeoutException as e:
+            overloaded = True
+            self.event_logger.log_data("request_error", f"Request timed out: {str(e)}")
+            raise TransientMoodleError(f"Request Timeout: {str(e)}")
+
         except httpx.RequestError as e:
             self.event_logger.log_data("request_error", f"Request failed: {str(e)}")
-            raise MoodleRESTError(f"Request Error: {str(e)}")
+            raise TransientMoodleError(f"Request Error: {str(e)}")
             
-        except json.JSONDecodeError as e:
+        except ValueError as e:  # json.JSONDecodeError, or a streamed array cut short
             self.event_logger.log_data("json_error", f"JSON decode error: {str(e)}")
             raise MoodleRESTError(f"JSON Decode Error: {str(e)}")
             
@@ -393,3 +756,6 @@ class moodle_rest:
                 f"Unexpected error with parameters: {parameters}, error: {str(e)}"
             )
             raise MoodleRESTError(f"Unexpected Error: {str(e)}")
+
+        finally:
+            self.concurrency_limiter.release(overloaded)
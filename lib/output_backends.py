@@ -0,0 +1,273 @@
+import os
+import re
+import ast
+import json
+import math
+from typing import Any, Dict, List, Optional
+import pandas as pd
+from lib.stream_writer import csv_stream_writer, jsonl_stream_writer, to_json_line
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Only needed for Parquet output (pip install pyarrow)
+    pa = None
+    pq = None
+
+# Parquet tables go under course_data/parquet/course=<idnumber>/type=<table>/, a hive partitioned dataset
+PARQUET_DIRECTORY = 'parquet'
+
+# Columns read back from CSV that fresh rows hold as numbers or flags (ids, sizes, times, counts) ...
+TYPED_COLUMN_SUFFIXES = (
+    '_id', '_cmid', '_contextid', '_visible', '_filesize', '_time_modified', '_timemodified', '_sortorder',
+    '_discussion', '_discussionid', '_parent', '_parentid', '_userid', '_usermodified', '_groupid', '_created',
+    '_modified', '_timecreated', '_timestart', '_timeend', '_numreplies', '_numunread', '_messageformat',
+    '_messagetrust', '_mailed', '_mailnow', '_totalscore', '_wordcount', '_charcount', '_pinned', '_locked',
+    '_starred', '_canreply', '_canlock', '_canfavourite', '_hasparent', '_unread', '_isdeleted',
+    '_isprivatereply', '_haswordcount',
+)
+TYPED_COLUMNS = ('is_used',)
+# ... and as lists or dicts (CSV holds their Python repr)
+NESTED_COLUMN_SUFFIXES = ('_files', '_tags')
+NESTED_COLUMNS = ('toc', 'forum_post_author', 'forum_post_capabilities', 'forum_post_urls', 'forum_post_attachments',
+                  'forum_post_messageinlinefiles', 'forum_post_html')
+NUMBER_PATTERN = re.compile(r'-?\d+(\.\d+)?')
+
+
+class csv_output:
+    """course_data/<idnumber>/<idnumber>_<table>.csv, one CSV per course table"""
+    name = 'csv'
+    supports_streaming = True
+    stream_by_default = False
+
+    def __init__(self, data_store_path: str) -> None:
+        self.data_store_path = data_store_path
+
+    def get_path(self, directory: str, filename: str) -> str:
+        return f"{self.data_store_path}{directory}/{filename}.csv"
+
+    def open_stream_writer(self, directory: str, filename: str, columns: List[str]) -> csv_stream_writer:
+        return csv_stream_writer(self.get_path(directory, filename), columns)
+
+    def write(self, item_to_save: Any, path: str) -> None:
+        if isinstance(item_to_save, pd.Series):
+            item_to_save.to_csv(path, header=False)
+        else:
+            item_to_save.to_csv(path, index=False)
+
+
+class parquet_output:
+    """
+    Compressed, typed Parquet, partitioned by course and table, so readers can load just the
+    columns they need (cmid and name without clean_html) of one course or of every course.
+    """
+    name = 'parquet'
+    supports_streaming = False
+    stream_by_default = False
+
+    def __init__(self, data_store_path: str) -> None:
+        if pq is None:
+            raise ImportError("Parquet output needs pyarrow (pip install pyarrow)")
+        self.data_store_path = data_store_path
+        self.compression = os.getenv('MOODLE_PARQUET_COMPRESSION', 'zstd')
+
+    def get_path(self, directory: str, filename: str) -> str:
+        table = filename[len(directory) + 1:] if filename.startswith(f"{directory}_") else filename
+        return os.path.join(self.data_store_path, PARQUET_DIRECTORY, f"course={directory}", f"type={table}", f"{filename}.parquet")
+
+    def write(self, item_to_save: Any, path: str) -> None:
+        if isinstance(item_to_save, pd.Series):
+            # The course record is a single row rather than CSV's key/value lines
+            item_to_save = pd.DataFrame([item_to_save.to_dict()])
+        pq.write_table(to_arrow_table(item_to_save), path, compression=self.compression)
+
+
+class jsonl_output:
+    """
+    course_data/<idnumber>/<idnumber>_<table>.jsonl, one JSON object per row. Module rows are
+    always streamed, appended as each module, chapter or post is produced.
+    """
+    name = 'jsonl'
+    supports_streaming = True
+    stream_by_default = True
+
+    def __init__(self, data_store_path: str) -> None:
+        self.data_store_path = data_store_path
+
+    def get_path(self, directory: str, filename: str) -> str:
+        return f"{self.data_store_path}{directory}/{filename}.jsonl"
+
+    def open_stream_writer(self, directory: str, filename: str, columns: List[str]) -> jsonl_stream_writer:
+        return jsonl_stream_writer(self.get_path(directory, filename), columns)
+
+    def write(self, item_to_save: Any, path: str) -> None:
+        if isinstance(item_to_save, pd.Series):
+            # The course record is a single line rather than CSV's key/value lines
+            item_to_save = pd.DataFrame([item_to_save.to_dict()])
+        columns = [str(column) for column in item_to_save.columns]
+        with open(path, 'w', encoding='utf-8') as file:
+            for record in item_to_save.to_dict('records'):
+                file.write(to_json_line({str(column): value for column, value in record.items()}, columns))
+
+
+OUTPUT_BACKENDS = {backend.name: backend for backend in (csv_output, parquet_output, jsonl_output)}
+
+
+def get_output_backend(name: Optional[str], data_store_path: str):
+    """Output backend by name (MOODLE_OUTPUT_FORMAT), csv when not set"""
+    name = (name or 'csv').lower()
+    if name not in OUTPUT_BACKENDS:
+        raise ValueError(f"Unknown output format {name}, expected one of {', '.join(OUTPUT_BACKENDS)}")
+    return OUTPUT_BACKENDS[name](data_store_path)
+
+
+def is_missing(value: Any) -> bool:
+    return value is None or value is pd.NA or (isinstance(value, float) and math.isnan(value))
+
+
+def to_text(value: Any) -> str:
+    """A value as the text its CSV field holds, missing values empty"""
+    return '' if is_missing(value) else str(value)
+
+
+def to_arrow_table(frame: pd.DataFrame):
+    """
+    Arrow table of a course table. Columns keep their types where Arrow can infer one, while
+    nested values (tags, files lists) and mixed columns are stored as the text the CSV would hold.
+    """
+    columns = {}
+    for column_name in frame.columns:
+        column = frame[column_name]
+        if column.dtype == object and any(isinstance(value, (list, tuple, dict, set)) for value in column):
+            columns[str(column_name)] = pa.array([None if is_missing(value) else str(value) for value in column], type=pa.string())
+            continue
+        try:
+            columns[str(column_name)] = pa.array(column, from_pandas=True)
+        except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError):
+            columns[str(column_name)] = pa.array([None if is_missing(value) else str(value) for value in column], type=pa.string())
+    return pa.table(columns)
+
+
+def get_parquet_course_path(course_path: str) -> str:
+    """The Parquet partition of a course_data/<idnumber> folder's course"""
+    course_path = os.path.normpath(course_path)
+    return os.path.join(os.path.dirname(course_path), PARQUET_DIRECTORY, f"course={os.path.basename(course_path)}")
+
+
+def get_table_paths(course_path: str, table: str) -> List[str]:
+    """Where a course table is saved as CSV, Parquet and JSON Lines, for a course_data/<idnumber> folder"""
+    course_idnumber = os.path.basename(os.path.normpath(course_path))
+    return [
+        os.path.join(course_path, f"{course_idnumber}_{table}.csv"),
+        os.path.join(get_parquet_course_path(course_path), f"type={table}", f"{course_idnumber}_{table}.parquet"),
+        os.path.join(course_path, f"{course_idnumber}_{table}.jsonl"),
+    ]
+
+
+def find_table(course_path: str, table: str) -> Optional[str]:
+    """The saved file of a course table (the newest one if it was saved in several formats), None if there isn't one"""
+    saved_paths = [path for path in get_table_paths(course_path, table) if os.path.exists(path)]
+    return max(saved_paths, key=os.path.getmtime) if saved_paths else None
+
+
+def has_course_tables(course_path: str) -> bool:
+    """Whether a course was saved, as CSVs in its folder or as Parquet"""
+    return os.path.isdir(course_path) or os.path.isdir(get_parquet_course_path(course_path))
+
+
+def read_table(course_path: str, table: str, columns: Optional[List[str]] = None, as_strings: bool = False) -> pd.DataFrame:
+    """
+    A course table (books, forums, ...) as a DataFrame, from its CSV, Parquet or JSON Lines file.
+
+    columns projects the table to those columns (ones it doesn't have are skipped), which for
+    Parquet means the others are never read. as_strings gives every value as the text its CSV
+    field holds, with missing values as ''. Raises FileNotFoundError if the table wasn't saved.
+    """
+    path = find_table(course_path, table)
+    if path is None:
+        raise FileNotFoundError(f"No {table} table saved for {course_path}")
+    return read_table_file(path, columns, as_strings)
+
+
+def read_table_file(path: str, columns: Optional[List[str]] = None, as_strings: bool = False) -> pd.DataFrame:
+    """A saved .csv, .parquet or .jsonl table as a DataFrame, with read_table's columns and as_strings"""
+    if path.endswith('.parquet'):
+        if pq is None:
+            raise ImportError(f"Reading {path} needs pyarrow (pip install pyarrow)")
+        if columns is not None:
+            saved_columns = pq.read_schema(path).names
+            columns = [column for column in columns if column in saved_columns]
+        frame = pq.read_table(path, columns=columns).to_pandas(integer_object_nulls=True)
+        if as_strings:
+            frame = pd.DataFrame({column: [to_text(value) for value in frame[column]] for column in frame.columns}, dtype=object)
+        return frame
+
+    if path.endswith('.jsonl'):
+        records = read_jsonl_records(path, columns)
+        if as_strings:
+            records = [{column: to_text(value) for column, value in record.items()} for record in records]
+        return pd.DataFrame(records)
+
+    if os.path.getsize(path) <= 1:  # A table with no rows or columns is saved as an empty line
+        return pd.DataFrame()
+    usecols = None if columns is None else (lambda column: column in columns)
+    if as_strings:
+        return pd.read_csv(path, usecols=usecols, dtype=str, keep_default_na=False)
+    return pd.read_csv(path, usecols=usecols)
+
+
+def read_rows(course_path: str, table: str, columns: Optional[List[str]] = None, keep_types: bool = False) -> List[Dict[str, Any]]:
+    """
+    A course table's rows as dicts of strings, like csv.DictReader gives, from its CSV, Parquet or JSON Lines file.
+    keep_types gives the values the types a freshly built row has instead: Parquet and JSON Lines values as
+    they were saved, CSV values restored by restore_csv_types.
+    """
+    path = find_table(course_path, table)
+    if path is None:
+        raise FileNotFoundError(f"No {table} table saved for {course_path}")
+    if keep_types and path.endswith('.jsonl'):
+        return read_jsonl_records(path, columns)  # Not through a DataFrame, which would turn ints with gaps into floats
+    as_strings = not (keep_types and path.endswith('.parquet'))
+    rows = read_table_file(path, columns, as_strings).to_dict('records')
+    if keep_types and path.endswith('.csv'):
+        return [restore_csv_types(row) for row in rows]
+    return rows
+
+
+def restore_csv_types(row: Dict[str, Any]) -> Dict[str, Any]:
+    """A row read from CSV as text, with its ids, sizes, times, flags and lists back to the types a fresh row has"""
+    return {column: restore_csv_value(column, value) for column, value in row.items()}
+
+
+def restore_csv_value(column: str, value: Any) -> Any:
+    """One CSV field as its column's type, text columns (names, HTML, ...) and unparseable values left as they are"""
+    if not isinstance(value, str):
+        return value
+    if column in NESTED_COLUMNS or column.endswith(NESTED_COLUMN_SUFFIXES):
+        if value == '':
+            return None
+        if value[:1] in '[{':
+            try:
+                return ast.literal_eval(value)
+            except (ValueError, SyntaxError):
+                return value
+        return value
+    if column in TYPED_COLUMNS or column.endswith(TYPED_COLUMN_SUFFIXES):
+        if value == '':
+            return None
+        if value in ('True', 'False'):
+            return value == 'True'
+        if NUMBER_PATTERN.fullmatch(value):
+            if '.' not in value:
+                return int(value)
+            number = float(value)
+            return int(number) if number.is_integer() else number  # pandas writes ints with gaps as 12.0
+    return value
+
+
+def read_jsonl_records(path: str, columns: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+    with open(path, encoding='utf-8') as file:
+        records = [json.loads(line) for line in file if line.strip()]
+    if columns is not None:
+        records = [{column: record[column] for column in columns if column in record} for record in records]
+    return records
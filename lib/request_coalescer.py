@@ -0,0 +1,106 @@
+import copy
+import json
+import threading
+from collections import Counter, OrderedDict
+from concurrent.futures import Future
+from typing import Dict, Any, Callable, Optional
+
+
+class request_coalescer:
+    """
+    Share one request between identical web-service calls in a run.
+
+    Callers asking for a request that is already in flight wait for it rather than
+    sending their own. Finished results are only kept when max_memo_bytes is set, as
+    JSON text in a small LRU memo bounded by its total size, so large responses
+    (core_course_get_contents, forum posts) are not pinned for the whole run. Every
+    caller gets its own copy of the result, so callers may modify it.
+    """
+
+    def __init__(self, max_memo_bytes: int = 0) -> None:
+        self.max_memo_bytes = max_memo_bytes
+        self.lock = threading.Lock()
+        self.in_flight = {}
+        self.waiters = Counter()  # key -> callers waiting on the in-flight request
+        self.memo = OrderedDict()  # key -> JSON text of the result
+        self.memo_bytes = 0
+        self.requests = Counter()
+        self.saved = Counter()
+
+    def make_key(self, moodle_function: str, parameters: Dict[str, Any]) -> str:
+        return json.dumps([moodle_function, sorted((k, str(v)) for k, v in parameters.items())])
+
+    def call(self, moodle_function: str, parameters: Dict[str, Any], fetch: Callable[[], Any]) -> Any:
+        """Return the result for this request, running fetch() only if nobody else is"""
+        key = self.make_key(moodle_function, parameters)
+        with self.lock:
+            if key in self.memo:
+                self.memo.move_to_end(key)
+                self.saved[moodle_function] += 1
+                return json.loads(self.memo[key])
+            future = self.in_flight.get(key)
+            is_owner = future is None
+            if is_owner:
+                future = Future()
+                self.in_flight[key] = future
+                self.requests[moodle_function] += 1
+            else:
+                self.waiters[key] += 1
+                self.saved[moodle_function] += 1
+
+        if not is_owner:
+            return copy.deepcopy(future.result())
+
+        try:
+            result = fetch()
+        except BaseException as e:
+            with self.lock:
+                del self.in_flight[key]
+                self.waiters.pop(key, None)
+            future.set_exception(e)
+            raise
+
+        text = self.to_memo_text(result) if self.max_memo_bytes else None
+        with self.lock:
+            # Nobody can join once the request has left in_flight, so the count is final
+            del self.in_flight[key]
+            waiters = self.waiters.pop(key, 0)
+            if text is not None:
+                self.remember(key, text)
+
+        # Waiters copy the published original; the owner only needs its own copy when
+        # someone else is reading it, otherwise the result is returned as is
+        owned = copy.deepcopy(result) if waiters else result
+        future.set_result(result)
+        return owned
+
+    def to_memo_text(self, result: Any) -> Optional[str]:
+        """The result as JSON text if it is small enough to remember, otherwise None"""
+        try:
+            text = json.dumps(result)
+        except (TypeError, ValueError):
+            return None
+        return text if len(text) <= self.max_memo_bytes else None
+
+    def remember(self, key: str, text: str) -> None:
+        """Keep a finished result in the memo, dropping the least recently used ones to stay within max_memo_bytes (call with the lock held)"""
+        if key in self.memo:
+            self.memo_bytes -= len(self.memo.pop(key))
+        self.memo[key] = text
+        self.memo_bytes += len(text)
+        while self.memo_bytes > self.max_memo_bytes:
+            _, dropped = self.memo.popitem(last=False)
+            self.memo_bytes -= len(dropped)
+
+    def clear(self) -> None:
+        with self.lock:
+            self.memo.clear()
+            self.memo_bytes = 0
+
+    def report(self) -> str:
+        total_saved = sum(self.saved.values())
+        total_requests = sum(self.requests.values())
+        lines = [f"Request coalescing: {total_requests} requests sent, {total_saved} duplicate calls saved"]
+        for moodle_function in sorted(self.saved):
+            lines.append(f"  {moodle_function}: {self.saved[moodle_function]} saved of {self.saved[moodle_function] + self.requests[moodle_function]} calls")
+        return "\n".join(lines)
@@ -0,0 +1,150 @@
+import os
+import json
+import time
+import zlib
+import sqlite3
+import hashlib
+import threading
+from collections import Counter
+from typing import Dict, Any, Optional, Tuple, Iterable
+
+# Default time to live (seconds) for responses that change rarely or often, anything else uses default_ttl
+DEFAULT_FUNCTION_TTLS = {
+    'core_course_get_courses': 24 * 3600,
+    'core_course_get_courses_by_field': 24 * 3600,
+    'mod_forum_get_forum_discussions': 600,
+    'mod_forum_get_discussion_posts': 600,
+    'core_webservice_get_site_info': 0,  # Never cached, used to check tokens are still valid
+}
+
+
+class response_cache:
+    """
+    Opt-in on-disk (SQLite) cache of Moodle web-service responses.
+
+    Entries are keyed by site, wsfunction and the flattened request parameters. Each
+    wsfunction can have its own TTL, and the least recently used entries are evicted
+    once the stored (compressed) size passes max_bytes.
+    """
+
+    def __init__(self, cache_path: str = 'course_data/.cache/moodle_responses.sqlite',
+                 default_ttl: int = 3600, function_ttls: Optional[Dict[str, int]] = None,
+                 max_bytes: int = 512 * 1024 * 1024, refresh: bool = False, offline: bool = False,
+                 bypass_functions: Optional[Iterable[str]] = None) -> None:
+        self.cache_path = cache_path
+        self.default_ttl = default_ttl
+        self.function_ttls = dict(DEFAULT_FUNCTION_TTLS)
+        self.function_ttls.update(function_ttls or {})
+        self.max_bytes = max_bytes
+        self.refresh = refresh  # Ignore stored entries but still save fresh responses
+        self.offline = offline  # Never go to Moodle, a miss is an error
+        self.bypass_functions = set(bypass_functions or [])
+        self.hits = Counter()
+        self.misses = Counter()
+        self.stores = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(cache_path) or '.', exist_ok=True)
+        self.connection = sqlite3.connect(cache_path, check_same_thread=False, timeout=30)  # Worker processes share the file
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, wsfunction TEXT, created REAL, last_access REAL, size INTEGER, payload BLOB)"
+        )
+        self.connection.execute("CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)")
+        self.connection.commit()
+        self.total_bytes = self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    @classmethod
+    def from_env(cls, refresh: bool = False, offline: bool = False, bypass_functions: Optional[Iterable[str]] = None):
+        """Build a cache from MOODLE_CACHE_* settings in .env"""
+        bypass = set(json.loads(os.getenv('MOODLE_CACHE_BYPASS', '[]')))
+        bypass.update(bypass_functions or [])
+        return cls(
+            cache_path=os.getenv('MOODLE_CACHE_PATH', 'course_data/.cache/moodle_responses.sqlite'),
+            default_ttl=int(os.getenv('MOODLE_CACHE_TTL', '3600')),
+            function_ttls=json.loads(os.getenv('MOODLE_CACHE_TTLS', '{}')),
+            max_bytes=int(os.getenv('MOODLE_CACHE_MAX_MB', '512')) * 1024 * 1024,
+            refresh=refresh,
+            offline=offline,
+            bypass_functions=bypass
+        )
+
+    def make_key(self, site: str, moodle_function: str, parameters: Dict[str, Any]) -> str:
+        key_source = json.dumps([site, moodle_function, sorted((k, str(v)) for k, v in parameters.items())])
+        return hashlib.sha256(key_source.encode('utf-8')).hexdigest()
+
+    def is_cacheable(self, moodle_function: str) -> bool:
+        return moodle_function not in self.bypass_functions and self.function_ttls.get(moodle_function, self.default_ttl) > 0
+
+    def get(self, site: str, moodle_function: str, parameters: Dict[str, Any]) -> Tuple[bool, Any]:
+        """Return (True, response) for a fresh entry, otherwise (False, None)"""
+        if self.refresh or not self.is_cacheable(moodle_function):
+            self.misses[moodle_function] += 1
+            return False, None
+        key = self.make_key(site, moodle_function, parameters)
+        ttl = self.function_ttls.get(moodle_function, self.default_ttl)
+        now = time.time()
+        with self.lock:
+            row = self.connection.execute("SELECT created, payload FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None or (now - row[0] > ttl and not self.offline):
+                self.misses[moodle_function] += 1
+                return False, None
+            self.connection.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+            self.connection.commit()
+        self.hits[moodle_function] += 1
+        return True, json.loads(zlib.decompress(row[1]))
+
+    def set(self, site: str, moodle_function: str, parameters: Dict[str, Any], response_data: Any) -> None:
+        if not self.is_cacheable(moodle_function):
+            return
+        key = self.make_key(site, moodle_function, parameters)
+        payload = zlib.compress(json.dumps(response_data).encode('utf-8'))
+        now = time.time()
+        with self.lock:
+            previous = self.connection.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            self.connection.execute(
+                "INSERT OR REPLACE INTO responses (key, wsfunction, created, last_access, size, payload) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, moodle_function, now, now, len(payload), payload)
+            )
+            self.total_bytes += len(payload) - (previous[0] if previous else 0)
+            self.stores += 1
+            self.evict()
+            self.connection.commit()
+
+    def evict(self) -> None:
+        """Drop least recently used entries until under max_bytes (call with lock held)"""
+        while self.total_bytes > self.max_bytes:
+            rows = self.connection.execute(
+                "SELECT key, size FROM responses ORDER BY last_access LIMIT 100"
+            ).fetchall()
+            if not rows:
+                self.total_bytes = 0
+                return
+            for key, size in rows:
+                self.connection.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self.total_bytes -= size
+                self.evictions += 1
+                if self.total_bytes <= self.max_bytes:
+                    break
+
+    def clear(self) -> None:
+        with self.lock:
+            self.connection.execute("DELETE FROM responses")
+            self.connection.commit()
+            self.total_bytes = 0
+
+    def report(self) -> str:
+        total_hits = sum(self.hits.values())
+        total_misses = sum(self.misses.values())
+        lookups = total_hits + total_misses
+        hit_rate = (100 * total_hits / lookups) if lookups else 0.0
+        lines = [f"Response cache: {total_hits} hits, {total_misses} misses ({hit_rate:.1f}% hit rate), "
+                 f"{self.stores} stored, {self.evictions} evicted, {self.total_bytes / (1024 * 1024):.1f} MB on disk"]
+        for moodle_function in sorted(set(self.hits) | set(self.misses)):
+            lines.append(f"  {moodle_function}: {self.hits[moodle_function]} hits, {self.misses[moodle_function]} misses")
+        return "\n".join(lines)
+
+    def close(self) -> None:
+        with self.lock:
+            self.connection.close()
@@ -0,0 +1,97 @@
+import os
+import csv
+import json
+import math
+from typing import Dict, Any, List
+
+
+class csv_stream_writer:
+    """
+    Appends records to a CSV as they are produced, with a fixed column schema.
+
+    Rows go to a temporary file next to final_path. save_item_raw hands that file to
+    save_course_data, which renames it into place with the rest of the course, so only
+    the row being written is ever held in memory.
+    """
+
+    def __init__(self, final_path: str, columns: List[str]) -> None:
+        self.final_path = final_path
+        self.temp_path = f"{final_path}.{os.getpid()}.part"
+        self.columns = columns
+        self.rows_written = 0
+        os.makedirs(os.path.dirname(final_path) or '.', exist_ok=True)
+        self.file = open(self.temp_path, 'w', newline='', encoding='utf-8')
+        self.writer = csv.DictWriter(self.file, fieldnames=columns, restval='', extrasaction='ignore')
+        self.writer.writeheader()
+
+    def write(self, record: Dict[str, Any]) -> None:
+        # Missing values are written empty, as DataFrame.to_csv does
+        self.writer.writerow({
+            key: '' if value is None or (isinstance(value, float) and math.isnan(value)) else value
+            for key, value in record.items()
+        })
+        self.rows_written += 1
+
+    def close(self) -> None:
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+            self.writer = None
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # Stage outputs are pickled by the harvest journal once the writer is closed
+        self.close()
+        return dict(self.__dict__)
+
+    def __len__(self) -> int:
+        return self.rows_written
+
+
+class jsonl_stream_writer:
+    """
+    Appends records to a JSON Lines file as they are produced, one object per line with
+    the same fixed columns as the CSV.
+
+    Like csv_stream_writer it writes to a temporary file that save_course_data renames
+    into place with the rest of the course. Lines are flushed as they are written, so the
+    temporary file can be tailed while the course is still being harvested.
+    """
+
+    def __init__(self, final_path: str, columns: List[str]) -> None:
+        self.final_path = final_path
+        self.temp_path = f"{final_path}.{os.getpid()}.part"
+        self.columns = columns
+        self.rows_written = 0
+        os.makedirs(os.path.dirname(final_path) or '.', exist_ok=True)
+        self.file = open(self.temp_path, 'w', encoding='utf-8', buffering=1)
+
+    def write(self, record: Dict[str, Any]) -> None:
+        self.file.write(to_json_line(record, self.columns))
+        self.rows_written += 1
+
+    def close(self) -> None:
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # Stage outputs are pickled by the harvest journal once the writer is closed
+        self.close()
+        return dict(self.__dict__)
+
+    def __len__(self) -> int:
+        return self.rows_written
+
+
+def to_json_value(value: Any) -> Any:
+    """json.dumps default for numpy scalars (and anything else as its text)"""
+    return value.item() if hasattr(value, 'item') else str(value)
+
+
+def to_json_line(record: Dict[str, Any], columns: List[str]) -> str:
+    """A record as a JSON Lines line with the given columns, missing values as null and nested ones (tags, files lists) as JSON"""
+    line = {}
+    for column in columns:
+        value = record.get(column)
+        line[column] = None if isinstance(value, float) and math.isnan(value) else value
+    return json.dumps(line, ensure_ascii=False, default=to_json_value) + '\n'
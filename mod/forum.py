@@ -1,4 +1,6 @@
-from .moodle_mod_helper import ModuleHelper
+from .moodle_mod_helper import ModuleHelper, FORUM_DISCUSSION_FIELDS, FORUM_POST_FIELDS
+from concurrent.futures import ThreadPoolExecutor
+import os
 import pandas as pd
 
 
@@ -6,32 +8,88 @@ class mod_forum:
     def __init__(self, moodle_rest) -> None:
         self.helper = ModuleHelper(moodle_rest, modtype='forum', component_name='component', content_field='discussion', has_subcomponents=False) # We do have subcomponents, but they need API calls to get them
         self.moodle_rest = moodle_rest
+        # Posts of a page of discussions are fetched concurrently (the connection's limiter still caps requests in flight)
+        self.post_pool = ThreadPoolExecutor(max_workers=int(os.getenv('MOODLE_FORUM_POST_WORKERS', '8')), thread_name_prefix='forum_posts')
 
-    def get_forum_content(self, course_modules, course):
-        forum_modules = course_modules[(course_modules['modname'] == 'forum')]
-        forum_modules_content = self.helper.get_mod_content(forum_modules, course)
-        forum_all_content = []
-        for _, forum in forum_modules_content.iterrows():
+    def close(self):
+        self.post_pool.shutdown(wait=True, cancel_futures=True)
+
+    def get_forum_content(self, course_modules, course, manifest=None, writer=None):
+        """
+        One row per post (with its discussion and forum fields), as a DataFrame or streamed to a stream writer (CSV or JSON Lines).
+        With a harvest_manifest, posts are only fetched for discussions modified or replied to since the last run.
+        """
+        forum_modules = self.helper.select_modules(course_modules)
+        forum_records = self.iter_forum_content(forum_modules, course, manifest)
+        if writer is not None:
             try:
-                forum_id = forum['forum_id']
-                forum_discussions = self.moodle_rest.get_forum_discussions(forum_id)
-                merged_forum_discussions = self.helper.process_forum_discussions(forum_discussions, forum, course)
-                for merged_forum_discussion in merged_forum_discussions:
-                    if "forum_discussion_id" not in merged_forum_discussion or merged_forum_discussion['forum_discussion_id'] is None:
-                        forum_discussion_posts = {'posts': []}
-                    else:
-                        forum_discussion_id = merged_forum_discussion['forum_discussion_discussion']
-                        forum_discussion_posts = self.moodle_rest.get_forum_discussion_posts(forum_discussion_id)
-
-                    if forum_discussion_posts is None or "exception" in forum_discussion_posts:
-                        forum_discussion_posts = {'posts': []}
-                    merged_forum_discussion_posts = self.helper.process_forum_discussion_posts(forum_discussion_posts, merged_forum_discussion, course)
-                    forum_all_content.append(merged_forum_discussion_posts)
+                for forum_record in forum_records:
+                    writer.write(forum_record)
+            finally:
+                writer.close()
+            return writer
+        return pd.DataFrame(list(forum_records))
+
+    def get_output_columns(self):
+        return ([f"forum_post_{field}" for field in FORUM_POST_FIELDS] +
+                [f"forum_discussion_{field}" for field in FORUM_DISCUSSION_FIELDS] +
+                self.helper.get_output_columns())
 
+    def iter_forum_content(self, forum_modules, course, manifest=None):
+        if manifest is not None:
+            manifest.load_previous_rows('forum', self.get_row_key, grouped=True)
+        for forum in self.helper.iter_mod_content(forum_modules, course):
+            try:
+                yield from self.iter_forum_posts(forum, course, manifest)
             except Exception as e:
                 print(f"An get forum posts or discussions error occurred: {e}")
 
-        forum_all_content_df = pd.DataFrame(forum_all_content)
-        return forum_all_content_df
+    def iter_forum_posts(self, forum, course, manifest=None):
+        """Post rows of one forum, a page of discussions at a time"""
+        has_discussions = False
+        for discussions in self.moodle_rest.iter_forum_discussion_pages(forum['forum_id']):
+            has_discussions = True
+            merged_forum_discussions = self.helper.process_forum_discussions({'discussions': discussions}, forum, course)
+            for discussion_rows in self.post_pool.map(lambda discussion: self.get_discussion_rows(discussion, course, manifest), merged_forum_discussions):
+                yield from discussion_rows
+
+        if not has_discussions:
+            for merged_forum_discussion in self.helper.process_forum_discussions({'discussions': []}, forum, course):
+                yield from self.helper.process_forum_discussion_posts({'posts': []}, merged_forum_discussion, course)
+
+    def get_discussion_rows(self, merged_forum_discussion, course, manifest=None):
+        """Post rows of one discussion, reused from the last run when its modified time and reply count are unchanged"""
+        if manifest is None or merged_forum_discussion.get('forum_discussion_id') is None:
+            forum_discussion_posts = self.get_discussion_posts(merged_forum_discussion)
+            return self.helper.process_forum_discussion_posts(forum_discussion_posts or {'posts': []}, merged_forum_discussion, course)
+
+        key = manifest.make_key('forum', merged_forum_discussion.get('forum_cmid'), merged_forum_discussion.get('forum_discussion_discussion'))
+        fingerprint = manifest.fingerprint({
+            field: merged_forum_discussion.get(f"forum_discussion_{field}") for field in ('timemodified', 'modified', 'numreplies')
+        })
+        fingerprint['numreplies'] = merged_forum_discussion.get('forum_discussion_numreplies')
+        previous_rows = manifest.get_unchanged_row('forum', key, fingerprint)
+        if previous_rows is not None:
+            # Discussion and forum fields are already in hand, only the posts come from the last run
+            for previous_row in previous_rows:
+                previous_row.update(merged_forum_discussion)
+            manifest.record('forum', key, fingerprint, reused=True)
+            return previous_rows
+
+        forum_discussion_posts = self.get_discussion_posts(merged_forum_discussion)
+        if forum_discussion_posts is not None:
+            manifest.record('forum', key, fingerprint, reused=False)  # A failed fetch is retried next run
+        return self.helper.process_forum_discussion_posts(forum_discussion_posts or {'posts': []}, merged_forum_discussion, course)
 
+    def get_discussion_posts(self, merged_forum_discussion):
+        """The discussion's posts response, {'posts': []} for no discussion, None if Moodle returned an error"""
+        if "forum_discussion_id" not in merged_forum_discussion or merged_forum_discussion['forum_discussion_id'] is None:
+            return {'posts': []}
+        forum_discussion_posts = self.moodle_rest.get_forum_discussion_posts(merged_forum_discussion['forum_discussion_discussion'])
+        if forum_discussion_posts is None or "exception" in forum_discussion_posts:
+            return None
+        return forum_discussion_posts
 
+    def get_row_key(self, row):
+        """Manifest key of a saved post row: its forum and discussion"""
+        return f"forum:{row.get('forum_cmid')}:{row.get('forum_discussion_discussion')}"
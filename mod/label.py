@@ -5,6 +5,8 @@ class mod_label:
     def __init__(self, moodle_rest) -> None:
         self.helper = ModuleHelper(moodle_rest, modtype='label', component_name='component', content_field='description', has_subcomponents=False)
         
-    def get_label_content(self, course_modules, course):
-        label_modules = course_modules[(course_modules['modname'] == 'label')]
-        return self.helper.get_mod_content(label_modules, course)
\ No newline at end of file
+    def get_label_content(self, course_modules, course, manifest=None, writer=None):
+        label_modules = self.helper.select_modules(course_modules)
+        if writer is not None:
+            return self.helper.write_mod_content(label_modules, course, writer, manifest)
+        return self.helper.get_mod_content(label_modules, course, manifest)
\ No newline at end of file
@@ -1,4 +1,4 @@
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Iterable, Iterator, Optional
 import pandas as pd
 import json
 import os
@@ -7,6 +7,26 @@ from urllib.parse import urlparse
 from lib.content_cleaners import content_cleaners
 from lib.content_utilities import content_utilities
 from lib.event_logger import EventLogger
+from lib.course_model import content_item
+from lib.link_matcher import find_linked_filenames
+
+# Module output columns, in the order rows are built, used for the fixed schema of streamed output
+MODULE_FIELDS = ['id', 'cmid', 'name', 'description', 'contextid', 'visible', 'url', 'section_id']
+
+# Forum discussion and post fields kept in the output, prefixed forum_discussion_ and forum_post_
+FORUM_DISCUSSION_FIELDS = [
+    'id', 'name', 'groupid', 'timemodified', 'usermodified', 'timestart', 'timeend', 
+    'discussion', 'parent', 'userid', 'created', 'modified', 'mailed', 'subject', 'message', 
+    'messageformat', 'messagetrust', 'attachment', 'totalscore', 'mailnow', 'userfullname', 
+    'usermodifiedfullname', 'userpictureurl', 'usermodifiedpictureurl', 'numreplies', 
+    'numunread', 'pinned', 'locked', 'starred', 'canreply', 'canlock', 'canfavourite'
+]
+FORUM_POST_FIELDS = [
+    'id', 'subject', 'replysubject', 'message', 'messageformat', 'author', 
+    'discussionid', 'hasparent', 'parentid', 'timecreated', 'timemodified', 
+    'unread', 'isdeleted', 'isprivatereply', 'haswordcount', 'wordcount', 
+    'charcount', 'capabilities', 'urls', 'attachments', 'messageinlinefiles', 'tags', 'html'
+]
 
 class ModuleHelper:
     """Helper class for processing Moodle module content"""
@@ -31,11 +51,42 @@ class ModuleHelper:
         self.data_store_path = 'course_data/'
 
     # Get and process the content of a module (course activity)
-    def get_mod_content(self, course_modules: pd.DataFrame, course: dict) -> pd.DataFrame:
-        """Generic getter for module content"""
-        results = []
+    def get_mod_content(self, course_modules: Iterable, course: dict, manifest=None) -> pd.DataFrame:
+        """
+        Generic getter for module content, course_modules is a DataFrame or an iterable of module dicts.
+        With a harvest_manifest, unchanged modules and items reuse their row from the previous run.
+        """
+        return pd.DataFrame(list(self.iter_mod_content(course_modules, course, manifest)))
+
+    def write_mod_content(self, course_modules: Iterable, course: dict, writer, manifest=None):
+        """Stream module content rows to a stream writer (CSV or JSON Lines), one at a time, and return the closed writer"""
+        try:
+            for record in self.iter_mod_content(course_modules, course, manifest):
+                writer.write(record)
+        finally:
+            writer.close()
+        return writer
 
-        for _, module_contents in course_modules.iterrows():
+    def get_output_columns(self) -> List[str]:
+        """Fixed column schema of this module type's rows"""
+        module_columns = ['course_id', 'course_name'] + [f'{self.modtype}_{field}' for field in MODULE_FIELDS]
+        if self.modtype == 'book':
+            module_columns.append('toc')
+        if not self.has_subcomponents:
+            return module_columns + list(content_item.CONTENT_FIELDS)
+        item_columns = [f'{self.component_name}_{field}' for field in content_item.RECORD_FIELDS]
+        if self.component_name == 'chapter':
+            item_columns.append('chapter_url')
+        return item_columns + module_columns + list(content_item.CONTENT_FIELDS) + ['is_used']
+
+    def iter_mod_content(self, course_modules: Iterable, course: dict, manifest=None) -> Iterator[dict]:
+        """Yield module content rows as they are processed, a module (or one chapter of it) at a time"""
+        if manifest is not None and not manifest.is_enabled_for(self.modtype):
+            manifest = None
+        if manifest is not None:
+            manifest.load_previous_rows(self.modtype, self._row_key)
+
+        for module_contents in self._iter_modules(course_modules):
             module_data = self._create_base_module_data(module_contents, course)
             
             contents = module_contents.get(self.content_field, [])
@@ -54,8 +105,9 @@ class ModuleHelper:
                 module_data['toc'] = toc
 
             if self.has_subcomponents:
-                processed_items = self.process_mod_items(contents, module_data, course)
-                results.extend(processed_items)
+                yield from self.iter_mod_items(contents, module_data, course, manifest)
+            elif manifest is not None and (reused_data := self._reuse_unchanged(manifest, contents, module_data)) is not None:
+                yield reused_data
             else:
                 output_path = os.path.join(self.data_store_path, course.get('idnumber'))
                 processed_content = self.content_cleaner.process_html_content(
@@ -67,43 +119,60 @@ class ModuleHelper:
                     module_data.get(f'{self.modtype}_instance', ''),
                 )
                 module_data.update(processed_content)
-                results.append(module_data)
+                if manifest is not None:
+                    key = manifest.make_key(self.modtype, module_data.get(f'{self.modtype}_cmid'))
+                    manifest.record(self.modtype, key, manifest.fingerprint(contents), reused=False)
+                yield module_data
+
 
-        return pd.DataFrame(results)
+    def select_modules(self, course_modules: Iterable):
+        """This module type's modules from a modules DataFrame or a list of course_module records"""
+        if isinstance(course_modules, pd.DataFrame):
+            return course_modules[(course_modules['modname'] == self.modtype)]
+        return [module for module in course_modules if module.get('modname') == self.modtype]
 
+    def _iter_modules(self, course_modules: Iterable) -> Iterator:
+        """Module rows from a DataFrame, or module dicts / course_module records from any other iterable"""
+        if isinstance(course_modules, pd.DataFrame):
+            yield from course_modules.to_dict('records')
+        else:
+            for module_contents in course_modules:
+                if module_contents.get('modname', self.modtype) == self.modtype:
+                    yield module_contents
 
     # Call this method whenever a mod activity has subcomponents
-    def process_mod_items(self, contents: List[dict], module_data: dict, course: dict) -> List[dict]:
+    def process_mod_items(self, contents: List[dict], module_data: dict, course: dict, manifest=None) -> List[dict]:
         """Generic processor for module items"""
-        items = []
-        
+        return list(self.iter_mod_items(contents, module_data, course, manifest))
+
+    def iter_mod_items(self, contents: List[dict], module_data: dict, course: dict, manifest=None) -> Iterator[dict]:
+        """Process module items one item id (e.g. a book chapter and its files) at a time"""
+        item_groups = {}
         for content in contents:
             if content['type'] != 'file':
                 self.event_logger.log_data(f'Unknown {self.modtype} {self.component_name} type', 
                     f"Content type: {content['type']} fileurl: {content['fileurl']} content: {content}")
                 continue
-            
-            item = self._process_item(content, module_data, course)
-            if item:
-                items.append(item)
-        
-        items.sort(key=lambda x: x.get('sortorder', 0))
-        return self._process_item_usage(items, module_data)
+            item_id = self.content_utilities.extract_item_id(content.get('filepath'), content.get('fileurl'))
+            item_groups.setdefault(item_id, []).append(content)
+
+        for group_contents in item_groups.values():
+            items = []
+            for content in group_contents:
+                if manifest is None:
+                    item = self._process_item(content, module_data, course)
+                else:
+                    item = self._process_item_incremental(content, module_data, course, manifest)
+                if item:
+                    items.append(item)
+
+            yield from self._process_item_usage(items, module_data)
 
 
 
     def process_forum_discussions(self, forum_discussions: Dict[str, List[Dict]], forum_data: Dict, course: Dict) -> List[Dict]:
-        # List of fields to rename
-        discussion_fields = [
-            'id', 'name', 'groupid', 'timemodified', 'usermodified', 'timestart', 'timeend', 
-            'discussion', 'parent', 'userid', 'created', 'modified', 'mailed', 'subject', 'message', 
-            'messageformat', 'messagetrust', 'attachment', 'totalscore', 'mailnow', 'userfullname', 
-            'usermodifiedfullname', 'userpictureurl', 'usermodifiedpictureurl', 'numreplies', 
-            'numunread', 'pinned', 'locked', 'starred', 'canreply', 'canlock', 'canfavourite'
-        ]
-        
         # Prepend 'forum_discussion_' to field names
-        prefixed_fields = {field: f"forum_discussion_{field}" for field in discussion_fields}
+        prefixed_fields = {field: f"forum_discussion_{field}" for field in FORUM_DISCUSSION_FIELDS}
         
         # Extract discussions list (default to empty list if key is missing)
         discussions = forum_discussions.get('discussions', [])
@@ -126,16 +195,8 @@ class ModuleHelper:
 
     
     def process_forum_discussion_posts(self, forum_posts: List[dict], discussion_data: dict, course: dict) -> List[dict]:
-        # List of fields to rename
-        post_fields = [
-            'id', 'subject', 'replysubject', 'message', 'messageformat', 'author', 
-            'discussionid', 'hasparent', 'parentid', 'timecreated', 'timemodified', 
-            'unread', 'isdeleted', 'isprivatereply', 'haswordcount', 'wordcount', 
-            'charcount', 'capabilities', 'urls', 'attachments', 'messageinlinefiles', 'tags', 'html'
-        ]
-        
         # Prepend 'forum_post_' to field names
-        prefixed_fields = {field: f"forum_post_{field}" for field in post_fields}
+        prefixed_fields = {field: f"forum_post_{field}" for field in FORUM_POST_FIELDS}
         
         # Extract posts list (default to empty list if key is missing)
         posts = forum_posts.get('posts', [])
@@ -174,7 +235,7 @@ class ModuleHelper:
         module_data = self.content_cleaner.check_module_data(module_data) # Remove any newlines from any field if it has html content
         return module_data
 
-    def _process_item(self, content: dict, module_data: dict, course: dict) -> dict:
+    def _process_item(self, content: dict, module_data: dict, course: dict) -> Optional[content_item]:
         """Process individual module item"""
         item_id = self.content_utilities.extract_item_id(content.get('filepath'), content.get('fileurl'))
         if item_id is None:
@@ -187,31 +248,18 @@ class ModuleHelper:
         
         item_html, item_type = self._get_item_content(item_url, content)
         
-        # Use component name in field names
-        item = {
-            f'{self.component_name}_id': item_id,
-            f'{self.component_name}_filename': filename,
-            f'{self.component_name}_type': item_type,
-            f'{self.component_name}_files': [],
-            f'{self.component_name}_title': content.get('content', ''),
-            f'{self.component_name}_filepath': content.get('filepath'),
-            f'{self.component_name}_filesize': content.get('filesize'),
-            f'{self.component_name}_fileurl': item_url,
-            f'{self.component_name}_time_modified': content.get('timemodified'),
-            f'{self.component_name}_sortorder': content.get('sortorder', 0),
-            f'{self.component_name}_tags': content.get('tags', [])
-        }
+        item = content_item(
+            item_id, filename, item_type, content.get('content', ''), content.get('filepath'), content.get('filesize'),
+            item_url, content.get('timemodified'), content.get('sortorder', 0), content.get('tags', []),
+            None, module_data, None, None
+        )
         if self.component_name == 'chapter':
-            item[f'{self.component_name}_url'] = f"{module_data.get('book_url')}&chapter={item.get('chapter_id')}"
-        
-        
-        # Add module data
-        item.update(module_data)
+            item.item_url = f"{module_data.get('book_url')}&chapter={item_id}"
         
         # Process HTML content if exists
         if item_html:
             output_path = os.path.join(self.data_store_path, course.get('idnumber'))
-            processed_content = self.content_cleaner.process_html_content(
+            item.processed = self.content_cleaner.process_html_content(
                 item_html,
                 output_path,
                 self.modtype,
@@ -219,10 +267,41 @@ class ModuleHelper:
                 module_data.get(f'{self.modtype}_name', ''),
                 str(item_id)
             )
-            item.update(processed_content)
             
         return item
 
+    def _process_item_incremental(self, content: dict, module_data: dict, course: dict, manifest) -> Optional[content_item]:
+        """_process_item, but an item unchanged since the last run reuses its previous row"""
+        key = manifest.make_key(self.modtype, module_data.get(f'{self.modtype}_cmid'), content.get('fileurl', ''))
+        fingerprint = manifest.fingerprint(content)
+        row = manifest.get_unchanged_row(self.modtype, key, fingerprint)
+        reused = row is not None
+        if reused:
+            # Module fields are cheap to refresh, and ids must match fresh items in the same group
+            item = content_item.from_record(row, self.component_name, module_data)
+            item.item_id = self.content_utilities.extract_item_id(content.get('filepath'), content.get('fileurl'))
+        else:
+            item = self._process_item(content, module_data, course)
+        if item:
+            manifest.record(self.modtype, key, fingerprint, reused=reused)
+        return item
+
+    def _reuse_unchanged(self, manifest, contents: Any, module_data: dict):
+        """Previous row of a module without subcomponents, refreshed with module_data, if its content is unchanged"""
+        key = manifest.make_key(self.modtype, module_data.get(f'{self.modtype}_cmid'))
+        fingerprint = manifest.fingerprint(contents)
+        row = manifest.get_unchanged_row(self.modtype, key, fingerprint)
+        if row is None:
+            return None
+        row.update(module_data)
+        manifest.record(self.modtype, key, fingerprint, reused=True)
+        return row
+
+    def _row_key(self, row: dict) -> str:
+        """Manifest key of a previously saved row"""
+        if self.has_subcomponents:
+            return f"{self.modtype}:{row.get(f'{self.modtype}_cmid')}:{row.get(f'{self.component_name}_fileurl')}"
+        return f"{self.modtype}:{row.get(f'{self.modtype}_cmid')}"
 
        
     def _extract_filename(self, url: str) -> str:
@@ -240,30 +319,32 @@ class ModuleHelper:
         return content.get('content'), 'file'
         
 
-    def _process_item_usage(self, items: List[dict], module_data: dict) -> List[dict]:
-        """Process item usage information"""
+    def _process_item_usage(self, items: List[content_item], module_data: dict) -> List[dict]:
+        """Process item usage information, returning the output rows"""
         items_with_file_check = []
-        
-        # Group items by ID
-        unique_item_ids = set(item[f'{self.component_name}_id'] for item in items)
-        
-        for item_id in unique_item_ids:
-            item_group = [i for i in items if i[f'{self.component_name}_id'] == item_id]
-            
-            html_item = next((i for i in item_group if i[f'{self.component_name}_type'] == 'html'), None)
+        is_visible = module_data.get(f'{self.modtype}_visible', False)
+
+        # Group items by ID in one pass
+        item_groups = {}
+        for item in items:
+            item_groups.setdefault(item.item_id, []).append(item)
+
+        for item_id in set(item_groups):  # Same order as before the index
+            item_group = item_groups[item_id]
+
+            html_item = next((i for i in item_group if i.item_type == 'html'), None)
             if html_item:
-                html_item['is_used'] = module_data.get(f'{self.modtype}_visible', False)
-                html_content = html_item.get('clean_html', '')
+                html_item.is_used = is_visible
+                html_content = (html_item.processed or {}).get('clean_html', '')
                 items_with_file_check.append(html_item)
-                
-                file_items = [i for i in item_group if i[f'{self.component_name}_type'] == 'file']
+
+                file_items = [i for i in item_group if i.item_type == 'file']
+                # A file is used when a link or src of its chapter points at it
+                linked_filenames = find_linked_filenames(html_content, (i.filename for i in file_items)) if is_visible else set()
                 for file_item in file_items:
-                    file_item['is_used'] = (
-                        module_data.get(f'{self.modtype}_visible', False) and 
-                        file_item[f'{self.component_name}_filename'] in html_content
-                    )
+                    file_item.is_used = is_visible and file_item.filename in linked_filenames
                     items_with_file_check.append(file_item)
-        
+
         return self.content_cleaner.clean_encoding_artifacts(
-            self.content_cleaner.clean_escaped_slashes(items_with_file_check)
-        )
\ No newline at end of file
+            self.content_cleaner.clean_escaped_slashes([item.to_record(self.component_name) for item in items_with_file_check])
+        )
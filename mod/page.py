@@ -5,6 +5,8 @@ class mod_page:
     def __init__(self, moodle_rest) -> None:
         self.helper = ModuleHelper(moodle_rest, modtype='page', component_name='component', content_field='contents', has_subcomponents=True)
         
-    def get_page_content(self, course_modules, course):
-        page_modules = course_modules[(course_modules['modname'] == 'page')]
-        return self.helper.get_mod_content(page_modules, course)
\ No newline at end of file
+    def get_page_content(self, course_modules, course, manifest=None, writer=None):
+        page_modules = self.helper.select_modules(course_modules)
+        if writer is not None:
+            return self.helper.write_mod_content(page_modules, course, writer, manifest)
+        return self.helper.get_mod_content(page_modules, course, manifest)
\ No newline at end of file
@@ -1,8 +1,12 @@
 import pandas as pd
 import os
+import sys
 import urllib.parse
 from pathlib import Path
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from lib.content_store import content_store
+
 def report_unused_moodle_book_files(base_path="course_data"):
     """
     Generate a report of the top 10 largest unused book files for each RVC course.
@@ -149,6 +153,24 @@ def report_unused_moodle_book_files(base_path="course_data"):
         print("No unused files found across all courses")
         return pd.DataFrame()
 
+def report_unused_moodle_book_files_from_store(store_path="course_data/content_store.sqlite", idnumber_pattern="RVC%"):
+    """
+    The same report as one indexed query on the content store (MOODLE_CONTENT_STORE=True),
+    instead of reading every course folder's CSVs.
+    """
+    store = content_store(store_path)
+    try:
+        report_df = store.get_unused_files(1048576, idnumber_pattern)
+    finally:
+        store.close()
+    if report_df.empty:
+        print("No unused files found across all courses")
+        return report_df
+    report_df['filename'] = report_df['filename'].map(lambda filename: f'"{urllib.parse.unquote(str(filename))}"')
+    report_df['filesize'] = report_df['filesize'].astype(int)
+    print(f"\nTotal unused files found: {len(report_df)}")
+    return report_df
+
 def save_report_to_csv(report_df, output_file="unused_moodle_book_files_report.csv"):
     """
     Save the report to a CSV file.
@@ -165,8 +187,12 @@ def save_report_to_csv(report_df, output_file="unused_moodle_book_files_report.c
 
 # Usage example
 if __name__ == "__main__":
-    # Generate the report
-    report = report_unused_moodle_book_files()
+    # Generate the report, from the content store when there is one
+    store_path = os.getenv('MOODLE_CONTENT_STORE_PATH', 'course_data/content_store.sqlite')
+    if os.path.exists(store_path):
+        report = report_unused_moodle_book_files_from_store(store_path)
+    else:
+        report = report_unused_moodle_book_files()
     
     # Save to CSV
     if not report.empty:
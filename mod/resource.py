@@ -8,9 +8,13 @@ class mod_resource:
         
     
 
-    def get_resource_content(self, course_resources, course):
-        resource_modules = course_resources[(course_resources['modname'] == 'resource')]
-        resource_list = self.resource_helper.get_mod_content(resource_modules, course)
-        folder_modules = course_resources[(course_resources['modname'] == 'folder')]
-        folder_list = self.folder_helper.get_mod_content(folder_modules, course)
+    def get_resource_content(self, course_resources, course, manifest=None, writers=None):
+        resource_modules = self.resource_helper.select_modules(course_resources)
+        folder_modules = self.folder_helper.select_modules(course_resources)
+        if writers is not None:
+            resource_writer, folder_writer = writers
+            return (self.resource_helper.write_mod_content(resource_modules, course, resource_writer, manifest),
+                    self.folder_helper.write_mod_content(folder_modules, course, folder_writer, manifest))
+        resource_list = self.resource_helper.get_mod_content(resource_modules, course, manifest)
+        folder_list = self.folder_helper.get_mod_content(folder_modules, course, manifest)
         return resource_list, folder_list
\ No newline at end of file
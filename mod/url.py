@@ -5,6 +5,8 @@ class mod_url:
     def __init__(self, moodle_rest) -> None:
         self.helper = ModuleHelper(moodle_rest, modtype='url', component_name='component', content_field='url', has_subcomponents=False)
         
-    def get_url_content(self, course_modules, course):
-        url_modules = course_modules[(course_modules['modname'] == 'url')]
-        return self.helper.get_mod_content(url_modules, course)
\ No newline at end of file
+    def get_url_content(self, course_modules, course, manifest=None, writer=None):
+        url_modules = self.helper.select_modules(course_modules)
+        if writer is not None:
+            return self.helper.write_mod_content(url_modules, course, writer, manifest)
+        return self.helper.get_mod_content(url_modules, course, manifest)
\ No newline at end of file
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+import os
+import sys
+import argparse
+import pandas as pd
+from dotenv import load_dotenv
+
+from lib.content_store import content_store
+
+
+def main():
+    load_dotenv(override=True)
+    parser = argparse.ArgumentParser(description="Query the content store of every harvested course (MOODLE_CONTENT_STORE=True).")
+    parser.add_argument("sql", nargs="?", help="SQL to run, e.g. \"SELECT course_idnumber, COUNT(*) FROM chapters GROUP BY 1\"")
+    parser.add_argument("--store", default=os.getenv('MOODLE_CONTENT_STORE_PATH', 'course_data/content_store.sqlite'), help="Content store database")
+    parser.add_argument("--unused-files", action="store_true", help="Largest unused book files across all courses")
+    parser.add_argument("--min-mb", type=float, default=1.0, help="Smallest file for --unused-files, in MB (default 1)")
+    parser.add_argument("--idnumber", default="%", help="Course idnumbers to include, SQL LIKE pattern (e.g. RVC%%)")
+    parser.add_argument("--tables", action="store_true", help="List the tables and their row counts")
+    parser.add_argument("--output", help="Write the result to this CSV instead of printing it")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.store):
+        print(f"No content store at {args.store}, harvest with MOODLE_CONTENT_STORE=True first")
+        sys.exit(1)
+
+    store = content_store(args.store)
+    try:
+        if args.tables:
+            result = pd.DataFrame(list(store.get_table_counts().items()), columns=['table', 'rows'])
+        elif args.unused_files:
+            result = store.get_unused_files(int(args.min_mb * 1024 * 1024), args.idnumber)
+        elif args.sql:
+            result = store.query(args.sql)
+        else:
+            parser.print_help()
+            return
+    finally:
+        store.close()
+
+    if args.output:
+        result.to_csv(args.output, index=False)
+        print(f"{len(result)} rows written to {args.output}")
+    else:
+        print(result.to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()